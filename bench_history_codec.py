@@ -0,0 +1,77 @@
+import os
+import json
+import random
+import tempfile
+import timeit
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+from habit import Habit
+from habit_tracker import save_data, load_data
+from history_codec import encode_history, decode_history, decode_columns
+
+
+def build_history(years: int = 5, seed: int = 0) -> list:
+    """
+    Build a realistic daily history: one check-off per day at a similar time, with a few missed days.
+
+    Args:
+        years (int): The number of years of history.
+        seed (int): The random seed.
+
+    Returns:
+        list: The check-off timestamps.
+    """
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1, 7, 0)
+    return [
+        start + timedelta(days=day, seconds=rng.randint(0, 3600), microseconds=rng.randint(0, 999999))
+        for day in range(years * 365)
+        if rng.random() > 0.02
+    ]
+
+
+def bench(func, number: int = 50, repeat: int = 5) -> float:
+    """
+    Return the run time of a function in milliseconds, as the best mean of several repeats.
+    """
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1000
+
+
+def main():
+    """
+    Compare the ISO JSON history format with the compressed history encoding.
+    """
+    checkoffs = build_history()
+    iso_text = json.dumps([check.isoformat() for check in checkoffs], indent=2)
+    blob = encode_history(checkoffs)
+    assert decode_history(blob) == checkoffs
+
+    print(f"Check-offs:               {len(checkoffs)}")
+    print(f"ISO JSON size:            {len(iso_text):>8} bytes")
+    print(f"Encoded size:             {len(blob):>8} bytes ({len(iso_text) / len(blob):.1f}x smaller)")
+
+    json_ms = bench(lambda: [datetime.fromisoformat(check) for check in json.loads(iso_text)])
+    decode_ms = bench(lambda: decode_history(blob))
+    columns_ms = bench(lambda: decode_columns(blob))
+    print(f"JSON parse + fromisoformat: {json_ms:8.3f} ms")
+    print(f"decode_history:             {decode_ms:8.3f} ms ({json_ms / decode_ms:.2f}x)")
+    print(f"decode_columns:             {columns_ms:8.3f} ms ({json_ms / columns_ms:.2f}x)")
+
+    habits = {f"Habit {i}": Habit(f"Habit {i}", "daily", checkoffs=list(checkoffs)) for i in range(10)}
+    with tempfile.TemporaryDirectory() as directory, open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        plain_file = os.path.join(directory, "plain_habits.json")
+        compact_file = os.path.join(directory, "compact_habits.json")
+        save_data(habits, plain_file)
+        save_data(habits, compact_file, compact=True)
+        plain_size, compact_size = os.path.getsize(plain_file), os.path.getsize(compact_file)
+        plain_ms = bench(lambda: load_data(plain_file), number=10)
+        compact_ms = bench(lambda: load_data(compact_file), number=10)
+
+    print(f"\nFile with {len(habits)} habits:")
+    print(f"  plain:   {plain_size:>9} bytes, load_data {plain_ms:8.3f} ms")
+    print(f"  compact: {compact_size:>9} bytes, load_data {compact_ms:8.3f} ms "
+          f"({plain_size / compact_size:.1f}x smaller, {plain_ms / compact_ms:.2f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+import os
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from history_codec import decode_columns
+from sharding import HABITS_SUFFIX, load_manifest
+from storage import get_storage
+from tiering import load_cold_archive
+
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+CohortKey = Tuple[str, str]  # (periodicity, habit name)
+
+
+class CohortHistogram:
+    """
+    Counts check-offs by weekday and hour of day, per periodicity and habit name.
+
+    Every (periodicity, habit name) pair owns a preallocated 7x24 count matrix, indexed by
+    weekday (Monday is 0) and hour. Check-offs are added as whole columns with `np.bincount`,
+    so aggregating is linear in the number of check-offs and never builds datetime objects.
+
+    Attributes:
+        counts (Dict[CohortKey, np.ndarray]): (periodicity, habit name) mapped to its 7x24 matrix.
+        users (int): The number of habits files aggregated.
+
+    Methods:
+    -------
+    add(periodicity: str, name: str, weekdays: np.ndarray, hours: np.ndarray) -> None
+        Count a column of check-offs of one habit.
+    merge(other: CohortHistogram) -> CohortHistogram
+        Add the counts of a partial result, such as one from a worker process.
+    by_periodicity() -> Dict[str, np.ndarray]
+        Return the matrices summed over habit names.
+    total() -> np.ndarray
+        Return the matrix summed over all habits.
+    """
+    def __init__(self) -> None:
+        self.counts: Dict[CohortKey, np.ndarray] = {}
+        self.users = 0
+
+    def matrix(self, periodicity: str, name: str) -> np.ndarray:
+        """
+        Return the count matrix of a habit, allocating it on first use.
+        """
+        key = (periodicity, name)
+        if key not in self.counts:
+            self.counts[key] = np.zeros((7, 24), dtype=np.int64)
+        return self.counts[key]
+
+    def add(self, periodicity: str, name: str, weekdays: np.ndarray, hours: np.ndarray) -> None:
+        """
+        Count a column of check-offs of one habit.
+
+        Args:
+            periodicity (str): The frequency of the habit.
+            name (str): The name of the habit.
+            weekdays (np.ndarray): The weekday of every check-off, Monday being 0.
+            hours (np.ndarray): The hour of every check-off.
+        """
+        if not len(weekdays):
+            return
+        cells = weekdays.astype(np.int64) * 24 + hours
+        self.matrix(periodicity, name)[:] += np.bincount(cells, minlength=7 * 24).reshape(7, 24)
+
+    def merge(self, other: "CohortHistogram") -> "CohortHistogram":
+        """
+        Add the counts of a partial result, such as one from a worker process.
+
+        Args:
+            other (CohortHistogram): The partial result.
+
+        Returns:
+            CohortHistogram: This histogram, for chaining.
+        """
+        for (periodicity, name), counts in other.counts.items():
+            self.matrix(periodicity, name)[:] += counts
+        self.users += other.users
+        return self
+
+    def by_periodicity(self) -> Dict[str, np.ndarray]:
+        """
+        Return the count matrices summed over habit names.
+
+        Returns:
+            Dict[str, np.ndarray]: Periodicities mapped to their 7x24 matrix.
+        """
+        totals: Dict[str, np.ndarray] = {}
+        for (periodicity, _), counts in self.counts.items():
+            totals[periodicity] = totals.get(periodicity, 0) + counts
+        return totals
+
+    def total(self) -> np.ndarray:
+        """
+        Return the count matrix summed over all habits.
+
+        Returns:
+            np.ndarray: The 7x24 matrix of all check-offs.
+        """
+        total = np.zeros((7, 24), dtype=np.int64)
+        for counts in self.counts.values():
+            total += counts
+        return total
+
+
+def iso_columns(checkoffs: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute the weekday and hour columns of ISO formatted check-offs.
+
+    The strings are parsed by NumPy into datetime64 values. Day 0 of datetime64 is
+    1970-01-01, a Thursday, hence the offset of 3 to make Monday 0.
+
+    Args:
+        checkoffs (List[str]): Check-offs as saved by `save_data`.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The weekday and hour of every check-off.
+    """
+    stamps = np.array(checkoffs, dtype='datetime64[us]')
+    days = stamps.astype('datetime64[D]')
+    weekdays = (days.astype(np.int64) + 3) % 7
+    hours = (stamps - days).astype('timedelta64[h]').astype(np.int64)
+    return weekdays, hours
+
+
+def history_columns(blob: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute the weekday and hour columns of a compressed history blob.
+
+    The day runs are expanded into day ordinals with `np.repeat`, and the hour column is read
+    straight from the blob. Ordinal 1 is a Monday.
+
+    Args:
+        blob (str): A history encoded by `encode_history`.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The weekday and hour of every check-off.
+    """
+    runs, hours, _, _, _ = decode_columns(blob)
+    if not runs:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    starts, lengths = np.array(runs, dtype=np.int64).T
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    weekdays = (np.repeat(starts, lengths) + offsets - 1) % 7
+    return weekdays, np.frombuffer(hours, dtype=np.uint8).astype(np.int64)
+
+
+def habit_files(data_directory: str, layout: str = "flat") -> List[str]:
+    """
+    List the habits files of every user in a data directory.
+
+    Args:
+        data_directory (str): The data directory of UserConn.
+        layout (str): 'flat' or 'sharded', as configured on UserConn.
+
+    Returns:
+        List[str]: The paths of the users' habits files.
+    """
+    if layout == "sharded":
+        return [os.path.join(data_directory, path) for path, _ in load_manifest(data_directory).values()]
+    return [
+        os.path.join(data_directory, name)
+        for name in sorted(get_storage().listdir(data_directory))
+        if name.endswith(HABITS_SUFFIX)
+    ]
+
+
+def aggregate_files(files: Iterable[str], include_cold: bool = True) -> CohortHistogram:
+    """
+    Stream habits files into a cohort histogram, one file at a time.
+
+    Missing or corrupt habits files are skipped, and so are corrupt cold archives, whose habits
+    file still counts its recent check-offs.
+
+    Args:
+        files (Iterable[str]): The habits files to aggregate.
+        include_cold (bool): Also count check-offs moved to each file's cold archive.
+
+    Returns:
+        CohortHistogram: The counts of all check-offs in the files.
+    """
+    histogram = CohortHistogram()
+    storage = get_storage()
+    for data_file in files:
+        try:
+            data = json.loads(storage.read_text(data_file))
+        except (FileNotFoundError, json.JSONDecodeError):
+            continue
+        histogram.users += 1
+
+        for habit_data in data.values():
+            if 'history' in habit_data:
+                weekdays, hours = history_columns(habit_data['history'])
+            else:
+                weekdays, hours = iso_columns(habit_data['checkoffs'])
+            histogram.add(habit_data['periodicity'], habit_data['name'], weekdays, hours)
+
+        if not include_cold:
+            continue
+        try:
+            archive = load_cold_archive(data_file)
+        except json.JSONDecodeError:
+            continue
+        if archive:
+            periodicities = {habit_data['name']: habit_data['periodicity'] for habit_data in data.values()}
+            for name, blob in archive.items():
+                if name in periodicities:
+                    histogram.add(periodicities[name], name, *history_columns(blob))
+    return histogram
+
+
+def build_cohort_report(data_directory: str, layout: str = "flat", workers: int = 1,
+                        include_cold: bool = True) -> CohortHistogram:
+    """
+    Aggregate the check-offs of all users by weekday and hour.
+
+    With several workers the files are split into one chunk per worker process, and the
+    partial histograms are merged. Worker processes read through the default file storage.
+
+    Args:
+        data_directory (str): The data directory of UserConn.
+        layout (str): 'flat' or 'sharded', as configured on UserConn.
+        workers (int): The number of worker processes.
+        include_cold (bool): Also count check-offs moved to the cold archive.
+
+    Returns:
+        CohortHistogram: The counts of all users' check-offs.
+    """
+    files = habit_files(data_directory, layout)
+    if workers <= 1 or len(files) < 2:
+        return aggregate_files(files, include_cold)
+
+    chunks = [files[index::workers] for index in range(workers)]
+    histogram = CohortHistogram()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for partial in pool.map(aggregate_files, chunks, [include_cold] * len(chunks)):
+            histogram.merge(partial)
+    return histogram
+
+
+def format_matrix(title: str, counts: np.ndarray) -> str:
+    """
+    Render a 7x24 count matrix with its busiest weekday and hour.
+
+    Args:
+        title (str): The heading of the matrix.
+        counts (np.ndarray): The 7x24 count matrix.
+
+    Returns:
+        str: The rendered matrix.
+    """
+    weekday, hour = np.unravel_index(np.argmax(counts), counts.shape)
+    lines = [
+        f"\n\033[1m{title}\033[0m: {counts.sum()} check-offs, busiest {WEEKDAYS[weekday]} {hour:02d}:00",
+        "     " + "".join(f"{column:>5}" for column in range(24)),
+    ]
+    lines.extend(f"{WEEKDAYS[day]:<5}" + "".join(f"{count:>5}" for count in counts[day]) for day in range(7))
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Print check-off counts by weekday and hour across all users, per periodicity and optionally per habit.
+    """
+    parser = argparse.ArgumentParser(description="Check-offs by weekday and hour across all HabitTracker users.")
+    parser.add_argument("--directory", default=os.path.dirname(os.path.abspath(__file__)), help="data directory")
+    parser.add_argument("--layout", choices=["flat", "sharded"], default="flat", help="data directory layout")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes")
+    parser.add_argument("--habits", action="store_true", help="also print one matrix per habit name")
+    parser.add_argument("--hot-only", action="store_true", help="skip check-offs in the cold archive")
+    args = parser.parse_args(argv)
+
+    histogram = build_cohort_report(args.directory, args.layout, args.workers, not args.hot_only)
+    print(f"\n\033[1mCohort report\033[0m: {histogram.users} users, {len(histogram.counts)} habits")
+    print(format_matrix("All habits", histogram.total()))
+    for periodicity, counts in sorted(histogram.by_periodicity().items()):
+        print(format_matrix(periodicity, counts))
+    if args.habits:
+        for (periodicity, name), counts in sorted(histogram.counts.items()):
+            print(format_matrix(f"{name} ({periodicity})", counts))
+
+
+if __name__ == "__main__":
+    main()
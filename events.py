@@ -0,0 +1,301 @@
+import json
+from collections import deque
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from typing import Callable, Deque, Dict, List, Optional, Tuple, Type
+from storage import get_storage
+
+
+@dataclass(frozen=True)
+class HabitEvent:
+    """
+    Base class of all habit change events.
+
+    Habit names are only unique per user, so every event also names the habits file of the
+    user it belongs to.
+
+    Attributes:
+        name (str): The name of the habit that changed.
+        at (datetime): The date and time when the change happened.
+        data_file (str): The habits file of the user the habit belongs to.
+    """
+    name: str
+    at: datetime = field(default_factory=datetime.now)
+    data_file: str = ''
+
+
+@dataclass(frozen=True)
+class HabitAdded(HabitEvent):
+    """
+    Emitted when a new habit is added.
+
+    Attributes:
+        periodicity (str): The frequency of the new habit.
+    """
+    periodicity: str = ''
+
+
+@dataclass(frozen=True)
+class HabitDeleted(HabitEvent):
+    """
+    Emitted when a habit is deleted.
+    """
+
+
+@dataclass(frozen=True)
+class HabitCheckedOff(HabitEvent):
+    """
+    Emitted when a habit is checked off. `at` is the check-off time.
+    """
+
+
+@dataclass(frozen=True)
+class StreakChanged(HabitEvent):
+    """
+    Emitted when a check-off changes the streak of a habit.
+
+    Attributes:
+        old_streak (int): The streak before the check-off.
+        new_streak (int): The streak after the check-off.
+    """
+    old_streak: int = 0
+    new_streak: int = 0
+
+
+EVENT_TYPES: Dict[str, Type[HabitEvent]] = {
+    cls.__name__: cls for cls in (HabitAdded, HabitDeleted, HabitCheckedOff, StreakChanged)
+}
+
+
+def event_to_dict(event: HabitEvent) -> Dict:
+    """
+    Convert an event to a JSON serializable dictionary.
+
+    Args:
+        event (HabitEvent): The event to convert.
+
+    Returns:
+        Dict: The event fields with its type name and an ISO formatted timestamp.
+    """
+    data = asdict(event)
+    data['type'] = type(event).__name__
+    data['at'] = event.at.isoformat()
+    return data
+
+
+def event_from_dict(data: Dict) -> HabitEvent:
+    """
+    Rebuild an event from a dictionary produced by `event_to_dict`.
+
+    Args:
+        data (Dict): The serialized event.
+
+    Returns:
+        HabitEvent: The typed event.
+    """
+    data = dict(data)
+    cls = EVENT_TYPES[data.pop('type')]
+    data['at'] = datetime.fromisoformat(data['at'])
+    return cls(**data)
+
+
+class Subscription:
+    """
+    A subscriber's bounded queue of pending events.
+
+    Subscribers with a callback receive events in batches of `batch_size` as soon as a
+    batch is full, and the remainder on `EventBus.flush`. Subscribers without a callback
+    pull events with `poll`. When the queue is full the oldest event is dropped and counted.
+
+    A batch whose callback raises stays queued and is retried with the next delivery, so a
+    failing subscriber neither loses events nor breaks the publisher or other subscribers.
+
+    Attributes:
+        callback (Callable, optional): Receives each delivered batch of events.
+        batch_size (int): The number of events delivered together.
+        max_queue (int): The maximum number of pending events.
+        dropped (int): The number of events dropped because the queue was full.
+        failures (int): The number of deliveries whose callback raised.
+        last_error (Exception, optional): The exception of the latest failed delivery.
+    """
+    def __init__(self, callback: Optional[Callable[[List[HabitEvent]], None]] = None,
+                 batch_size: int = 1, max_queue: int = 1024) -> None:
+        if batch_size < 1 or max_queue < batch_size:
+            raise ValueError("batch_size must be at least 1 and no larger than max_queue.")
+        self.callback = callback
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self.dropped = 0
+        self.failures = 0
+        self.last_error: Optional[Exception] = None
+        self.pending: Deque[HabitEvent] = deque()
+
+    def push(self, event: HabitEvent) -> None:
+        """
+        Queue an event, delivering a batch if one is complete.
+
+        Args:
+            event (HabitEvent): The event to queue.
+        """
+        if len(self.pending) >= self.max_queue:
+            self.pending.popleft()
+            self.dropped += 1
+        self.pending.append(event)
+        if self.callback and len(self.pending) >= self.batch_size:
+            self.deliver(self.batch_size)
+
+    def deliver(self, limit: Optional[int] = None) -> None:
+        """
+        Deliver up to `limit` pending events to the callback as one batch.
+
+        Args:
+            limit (int, optional): The maximum number of events to deliver. Defaults to all.
+        """
+        batch = self.poll(limit)
+        if batch and self.callback:
+            try:
+                self.callback(batch)
+            except Exception as error:
+                self.pending.extendleft(reversed(batch))
+                self.failures += 1
+                self.last_error = error
+
+    def poll(self, limit: Optional[int] = None) -> List[HabitEvent]:
+        """
+        Remove and return up to `limit` pending events.
+
+        Args:
+            limit (int, optional): The maximum number of events to return. Defaults to all.
+
+        Returns:
+            List[HabitEvent]: The oldest pending events.
+        """
+        count = len(self.pending) if limit is None else min(limit, len(self.pending))
+        return [self.pending.popleft() for _ in range(count)]
+
+
+class EventBus:
+    """
+    An in-process publisher of habit change events.
+
+    Methods:
+    -------
+    subscribe(callback, batch_size, max_queue) -> Subscription
+        Register a subscriber with its own bounded queue.
+    unsubscribe(subscription) -> None
+        Stop delivering events to a subscriber.
+    publish(event) -> None
+        Queue an event for every subscriber.
+    flush() -> None
+        Deliver all pending events to callback subscribers.
+    """
+    def __init__(self) -> None:
+        self.subscriptions: List[Subscription] = []
+
+    def subscribe(self, callback: Optional[Callable[[List[HabitEvent]], None]] = None,
+                  batch_size: int = 1, max_queue: int = 1024) -> Subscription:
+        """
+        Register a subscriber.
+
+        Args:
+            callback (Callable, optional): Receives batches of events. Omit to poll instead.
+            batch_size (int): The number of events delivered together.
+            max_queue (int): The maximum number of pending events kept for the subscriber.
+
+        Returns:
+            Subscription: The subscriber's queue.
+        """
+        subscription = Subscription(callback, batch_size, max_queue)
+        self.subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """
+        Stop delivering events to a subscriber. Pending events are delivered first.
+
+        Args:
+            subscription (Subscription): The subscriber to remove.
+        """
+        if subscription in self.subscriptions:
+            subscription.deliver()
+            self.subscriptions.remove(subscription)
+
+    def publish(self, event: HabitEvent) -> None:
+        """
+        Queue an event for every subscriber.
+
+        Args:
+            event (HabitEvent): The event to publish.
+        """
+        for subscription in self.subscriptions:
+            subscription.push(event)
+
+    def flush(self) -> None:
+        """
+        Deliver all pending events to callback subscribers.
+        """
+        for subscription in self.subscriptions:
+            if subscription.callback:
+                subscription.deliver()
+
+
+class EventLog:
+    """
+    A durable, append-only change feed stored as JSON lines.
+
+    Offsets are byte positions in the feed file, so a consumer stores the offset returned by
+    `read` and resumes from it later without rescanning earlier events.
+
+    Methods:
+    -------
+    append(events: List[HabitEvent]) -> int
+        Append a batch of events and return the offset after it.
+    read(offset: int, limit: int) -> Tuple[List[HabitEvent], int]
+        Read events starting at an offset and return them with the next offset.
+    """
+    def __init__(self, feed_file: str) -> None:
+        self.feed_file = feed_file
+
+    def append(self, events: List[HabitEvent]) -> int:
+        """
+        Append a batch of events to the feed. Usable directly as a subscriber callback.
+
+        Args:
+            events (List[HabitEvent]): The events to append.
+
+        Returns:
+            int: The offset just past the appended events.
+        """
+        lines = "".join(json.dumps(event_to_dict(event), separators=(",", ":")) + "\n" for event in events)
+        return get_storage().append_text(self.feed_file, lines)
+
+    def read(self, offset: int = 0, limit: Optional[int] = None) -> Tuple[List[HabitEvent], int]:
+        """
+        Read events from the feed, starting at an offset.
+
+        Args:
+            offset (int): The offset to start from, as returned by a previous read.
+            limit (int, optional): The maximum number of events to read. Defaults to all.
+
+        Returns:
+            Tuple[List[HabitEvent], int]: The events read and the offset to resume from.
+        """
+        events: List[HabitEvent] = []
+        try:
+            lines = get_storage().read_lines(self.feed_file, offset)
+        except FileNotFoundError:
+            return events, offset
+
+        # Stream the feed in binary, so offsets are byte counts and only the lines read are loaded
+        with lines:
+            for line in lines:
+                if limit is not None and len(events) >= limit:
+                    break
+                if not line.endswith(b"\n"):
+                    break  # A batch still being written
+                events.append(event_from_dict(json.loads(line)))
+                offset += len(line)
+        return events, offset
+
+
+default_bus = EventBus()
@@ -1,6 +1,34 @@
+from bisect import bisect_right
+from itertools import count
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List
+from typing import Dict, List, Optional, Tuple
+from events import EventBus, HabitCheckedOff, StreakChanged, default_bus
+from periodicity import key_function, period_name
+
+
+CHECKPOINT_INTERVAL = 64
+
+
+@dataclass
+class HistorySummary:
+    """
+    Summarizes the check-offs of a habit that were moved to the cold archive.
+
+    Attributes:
+        horizon (datetime): Check-offs before this date and time are archived.
+        count (int): The number of archived check-offs.
+        monthly (Dict[str, int]): Archived check-offs per 'YYYY-MM' month.
+        runs (List[Tuple[int, int]]): First and last period keys of each run of consecutive periods.
+        longest_streak (int): The longest run of consecutive periods in the archive.
+        last_checkoff (datetime, optional): The latest archived check-off.
+    """
+    horizon: datetime
+    count: int = 0
+    monthly: Dict[str, int] = field(default_factory=dict)
+    runs: List[Tuple[int, int]] = field(default_factory=list)
+    longest_streak: int = 0
+    last_checkoff: Optional[datetime] = None
 
 
 @dataclass
@@ -10,76 +38,325 @@ class Habit:
 
     Attributes:
         name (str): The name of the habit.
-        periodicity (str): The frequency of the habit ('daily' or 'weekly').
+        periodicity (str): The frequency of the habit ('daily', 'weekly', 'every_<n>_days' or 'weekdays:<days>').
         checkoffs (List[datetime]): Dates and times when the habit was checked off.
         streak (int): The current streak of consecutive completions.
         created_at (datetime): The date and time when the habit was created.
+        archive (HistorySummary, optional): Summary of check-offs moved to the cold archive.
+        version (int): Incremented on every change to the check-offs or the streak. The version
+            of the HabitSet holding the habit is incremented along with it.
     """
     name: str
-    periodicity: str  # 'daily' or 'weekly'
+    periodicity: str  # 'daily', 'weekly', 'every_<n>_days' or 'weekdays:<days>'
     checkoffs: List[datetime] = field(default_factory=list)
     streak: int = 0
     created_at: datetime = field(default_factory=datetime.now)
+    archive: Optional[HistorySummary] = None
+    version: int = field(default=0, init=False, repr=False, compare=False)
+    _owner: Optional["HabitSet"] = field(default=None, init=False, repr=False, compare=False)
+    _period_keys: Dict[datetime, int] = field(default_factory=dict, init=False, repr=False, compare=False)
+    _checkpoint_state: Optional[Tuple] = field(default=None, init=False, repr=False, compare=False)
+
+    def period_key(self, when: datetime) -> int:
+        """
+        Returns the integer key of the period containing a timestamp, caching keys of check-offs.
+
+        Args:
+            when (datetime): The timestamp to map.
+
+        Returns:
+            int: The period key.
+        """
+        key = self._period_keys.get(when)
+        if key is None:
+            key = self._period_keys[when] = key_function(self.periodicity)(when)
+        return key
+
+    def mark_changed(self) -> None:
+        """
+        Increments the version of the habit and of the HabitSet holding it.
+        """
+        self.version += 1
+        if self._owner is not None:
+            self._owner.version += 1
+
+    def last_checkoff(self) -> Optional[datetime]:
+        """
+        Returns the latest check-off, from the archive summary if the recent window is empty.
+
+        Returns:
+            datetime, optional: The latest check-off, or None if the habit was never checked off.
+        """
+        if self.checkoffs:
+            return self.checkoffs[-1]
+        return self.archive.last_checkoff if self.archive else None
 
-    def check_off(self) -> None:
+    def prune_period_keys(self) -> None:
+        """
+        Drops cached period keys of timestamps that are no longer check-offs, e.g. after archiving.
+        """
+        self._period_keys = {check: self._period_keys[check] for check in self.checkoffs if check in self._period_keys}
+
+    def check_off(self, bus: Optional[EventBus] = None, data_file: str = '') -> None:
         """
         Marks the habit as completed for the current date and time. Updates the streak if it's a new checkoff.
+
+        Args:
+            bus (EventBus, optional): The bus receiving the change events. Defaults to the shared bus.
+            data_file (str): The habits file of the user the habit belongs to, identifying the
+                user in the change events.
         """
+        bus = bus or default_bus
         now = datetime.now()
-        
-        # Check if the habit has already been checked off today (for daily habits) or this week (for weekly habits)
-        if self.periodicity == 'daily':
-            already_checked = any(check.date() == now.date() for check in self.checkoffs)
-        elif self.periodicity == 'weekly':
-            already_checked = any((now - check).days < 7 for check in self.checkoffs)
+        now_key = key_function(self.periodicity)(now)
+
+        # Check-offs are kept sorted, so only the latest one can fall into the current period
+        already_checked = bool(self.checkoffs) and self.period_key(self.checkoffs[-1]) == now_key
 
         if not already_checked:
+            old_streak = self.streak
             self.checkoffs.append(now)
+            self._period_keys[now] = now_key
+            self.mark_changed()
             self.update_streak()
+            bus.publish(HabitCheckedOff(self.name, now, data_file))
+            if self.streak != old_streak:
+                bus.publish(StreakChanged(self.name, now, data_file, old_streak, self.streak))
             print(f"Habit '\033[1m{self.name}\033[0m' checked off at {now}.")
         else:
-            print(f"Habit '\033[1m{self.name}\033[0m' is already checked off for the current {'day' if self.periodicity == 'daily' else 'week'}.")
+            print(f"Habit '\033[1m{self.name}\033[0m' is already checked off for the current {period_name(self.periodicity)}.")
 
     def update_streak(self) -> None:
         """
         Updates the streak based on the habit's checkoffs, accounting for periodicity.
         """
+        self.mark_changed()
         if not self.checkoffs:
-            self.streak = 0
+            if not self.archive:
+                self.streak = 0
             return
 
         # Sort checkoffs by date and time
         self.checkoffs.sort()
-        current_streak = 1
-        last_check = self.checkoffs[0]
+        last_key = self.period_key(self.checkoffs[0])
+        current_streak = self._initial_run(last_key)
 
         for check in self.checkoffs[1:]:
-            if self.periodicity == 'daily' and (check.date() - last_check.date()).days == 1:
-                current_streak += 1
-            elif self.periodicity == 'weekly' and 0 < (check.date() - last_check.date()).days <= 7:
+            key = self.period_key(check)
+            if key == last_key + 1:
                 current_streak += 1
-            else:
+            elif key != last_key:
                 current_streak = 1
-            last_check = check
+            last_key = key
 
         self.streak = max(self.streak, current_streak)
 
-    def is_broken(self) -> bool:
+    def _initial_run(self, first_key: int) -> int:
+        """
+        Returns the run length at the first check-off, continuing a run that started in the cold archive.
+
+        Args:
+            first_key (int): The period key of the first check-off.
+
+        Returns:
+            int: The run length including the first check-off.
+        """
+        if self.archive and self.archive.runs:
+            run_start, tail_key = self.archive.runs[-1]
+            if first_key - tail_key in (0, 1):
+                return first_key - run_start + 1
+        return 1
+
+    def _archive_tail(self) -> Optional[Tuple[int, int]]:
+        """
+        Returns the first and last period keys of the last run in the cold archive, if any.
+        """
+        if self.archive and self.archive.runs:
+            return tuple(self.archive.runs[-1])
+        return None
+
+    def _check_horizon(self, when: datetime) -> None:
+        """
+        Raises ValueError for reference times before the archive horizon.
+
+        The summary only keeps runs of whole periods, which cannot tell whether a check-off in
+        the period of `when` came before or after it.
+        """
+        if self.archive and when < self.archive.horizon:
+            raise ValueError(f"{when} is before the archive horizon {self.archive.horizon} of '{self.name}'; "
+                             "query the cold history instead.")
+
+    def is_broken(self, now: Optional[datetime] = None) -> bool:
         """
         Determines if the habit streak is broken.
 
+        Args:
+            now (datetime, optional): The reference time. Only check-offs up to it are considered.
+                Defaults to the current time.
+
         Returns:
             bool: True if the streak is broken, False otherwise.
+
+        Raises:
+            ValueError: If `now` is before the horizon of the cold archive.
         """
-        if not self.checkoffs:
+        if now is None:
+            now = datetime.now()
+            index = len(self.checkoffs) - 1
+        else:
+            self._check_horizon(now)
+            index = bisect_right(self.checkoffs, now) - 1
+
+        # Without a recent check-off up to `now`, the last one is the tail of the archive
+        if index >= 0:
+            last_key = self.period_key(self.checkoffs[index])
+        elif self._archive_tail():
+            last_key = self._archive_tail()[1]
+        else:
             return True
 
-        last_check = self.checkoffs[-1]
-        now = datetime.now()
+        now_key = key_function(self.periodicity)(now)
+        return now_key - last_key > 1
 
-        if self.periodicity == 'daily' and (now.date() - last_check.date()).days > 1:
-            return True
-        elif self.periodicity == 'weekly' and (now.date() - last_check.date()).days > 7:
-            return True
+    def streak_as_of(self, when: datetime) -> int:
+        """
+        Determines the streak that was running at a past date and time.
+
+        Only the check-offs since the nearest checkpoint are replayed, so repeated historical
+        queries cost O(CHECKPOINT_INTERVAL) after the checkpoints have been built once.
+        Streaks continuing from the cold archive are counted from its summary runs.
+        The check-offs must be sorted, which `update_streak` guarantees.
+
+        Args:
+            when (datetime): The reference time.
+
+        Returns:
+            int: The number of consecutive periods completed up to `when`, or 0 if the streak was
+            broken at that time.
+
+        Raises:
+            ValueError: If `when` is before the horizon of the cold archive.
+        """
+        if self.is_broken(when):
+            return 0
+        index = bisect_right(self.checkoffs, when) - 1
+        if index < 0:
+            run_start, tail_key = self._archive_tail()
+            return tail_key - run_start + 1
+
+        checkpoint = index // CHECKPOINT_INTERVAL
+        last_key, current_streak = self._streak_checkpoints()[checkpoint]
+        for check in self.checkoffs[checkpoint * CHECKPOINT_INTERVAL + 1:index + 1]:
+            key = self.period_key(check)
+            if key == last_key + 1:
+                current_streak += 1
+            elif key != last_key:
+                current_streak = 1
+            last_key = key
+        return current_streak
+
+    def _streak_checkpoints(self) -> Tuple[Tuple[int, int], ...]:
+        """
+        Returns the (period key, run length) state after every CHECKPOINT_INTERVAL-th check-off.
+
+        New check-offs extend the checkpoints from the state at the last check-off they covered.
+        They are only rebuilt when the covered check-offs or the archive changed. The checkpoints
+        are built in local variables and published with one assignment of an immutable tuple,
+        so concurrent readers of a snapshot never see them half built.
+
+        Returns:
+            Tuple[Tuple[int, int], ...]: The streak state at check-offs 0, CHECKPOINT_INTERVAL, 2 * CHECKPOINT_INTERVAL, ...
+        """
+        checkoffs = self.checkoffs
+        tail = self._archive_tail()
+        state = self._checkpoint_state
+        covered, last_key, current_streak, checkpoints = 0, 0, 0, ()
+        if state and checkoffs:
+            state_covered, state_tail, first, last, state_key, state_streak, state_checkpoints = state
+            if (state_tail == tail and state_covered <= len(checkoffs)
+                    and checkoffs[0] == first and checkoffs[state_covered - 1] == last):
+                if state_covered == len(checkoffs):
+                    return state_checkpoints
+                covered, last_key, current_streak, checkpoints = state_covered, state_key, state_streak, state_checkpoints
+
+        added: List[Tuple[int, int]] = []
+        for index in range(covered, len(checkoffs)):
+            key = self.period_key(checkoffs[index])
+            if index == 0:
+                current_streak = self._initial_run(key)
+            elif key == last_key + 1:
+                current_streak += 1
+            elif key != last_key:
+                current_streak = 1
+            last_key = key
+            if index % CHECKPOINT_INTERVAL == 0:
+                added.append((key, current_streak))
+
+        checkpoints += tuple(added)
+        if checkoffs:
+            self._checkpoint_state = (len(checkoffs), tail, checkoffs[0], checkoffs[-1],
+                                      last_key, current_streak, checkpoints)
+        return checkpoints
+
+
+_habit_set_ids = count()
+
+
+class HabitSet(Dict[str, Habit]):
+    """
+    A user's dictionary of habits that counts its own mutations.
+
+    Adding, replacing or removing a habit increments `version`, and so does every change to a
+    habit it holds, so the version alone tells cached analytics whether they are still current.
+    A habit reports its changes to the set it was most recently added to.
+
+    Attributes:
+        version (int): Incremented on every added, replaced, removed or changed habit.
+        uid (int): Distinguishes this set from other sets in caches.
+    """
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.version = 0
+        self.uid = next(_habit_set_ids)
+        self._adopt_all()
+
+    def _adopt_all(self) -> None:
+        """
+        Makes every habit report its changes to this set.
+        """
+        for habit in self.values():
+            if habit is not None:
+                habit._owner = self
+
+    def __setitem__(self, name: str, habit: Habit) -> None:
+        super().__setitem__(name, habit)
+        habit._owner = self
+        self.version += 1
+
+    def __delitem__(self, name: str) -> None:
+        super().__delitem__(name)
+        self.version += 1
+
+    def pop(self, *args):
+        self.version += 1
+        return super().pop(*args)
+
+    def popitem(self):
+        self.version += 1
+        return super().popitem()
+
+    def setdefault(self, name: str, habit: Optional[Habit] = None):
+        self.version += 1
+        habit = super().setdefault(name, habit)
+        if habit is not None:
+            habit._owner = self
+        return habit
+
+    def update(self, *args, **kwargs) -> None:
+        super().update(*args, **kwargs)
+        self._adopt_all()
+        self.version += 1
 
-        return False
\ No newline at end of file
+    def clear(self) -> None:
+        super().clear()
+        self.version += 1
@@ -1,8 +1,18 @@
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime, timedelta
-import json
 import os
-from habit import Habit
+import sys
+import json
+from habit import Habit, HabitSet, HistorySummary
+from memo import AnalyticsCache
+from storage import get_storage
+from periodicity import is_valid_periodicity
+from history_codec import encode_history, decode_history
+from events import EventBus, HabitAdded, HabitDeleted, default_bus
+
+
+# Results of the analytics below, for habit sets loaded with `load_data`
+analytics_cache = AnalyticsCache(maxsize=128)
 
 
 def load_predefined_habits(habits: Dict[str, Habit]) -> Dict[str, Habit]:
@@ -46,21 +56,23 @@ def load_predefined_habits(habits: Dict[str, Habit]) -> Dict[str, Habit]:
     print("Predefined habits with example tracking data loaded successfully.")
     return habits
 
-def add_habit(habits: Dict[str, Habit], name: str, periodicity: str, data_file: str) -> Dict[str, Habit]:
+def add_habit(habits: Dict[str, Habit], name: str, periodicity: str, data_file: str,
+              bus: Optional[EventBus] = None) -> Dict[str, Habit]:
     """
     Add a new habit with the specified name and periodicity.
 
     Args:
         habits (Dict[str, Habit]): The current dictionary of habits.
         name (str): The name of the new habit.
-        periodicity (str): The frequency of the habit ('daily' or 'weekly').
+        periodicity (str): The frequency of the habit ('daily', 'weekly', 'every_<n>_days' or 'weekdays:<days>').
         data_file (str): The file path for saving the data.
+        bus (EventBus, optional): The bus receiving the change events. Defaults to the shared bus.
 
     Returns:
         Dict[str, Habit]: Updated dictionary of habits with the new habit added.
     """
-    if periodicity not in ['daily', 'weekly']:
-        print("Invalid periodicity. Please use 'daily' or 'weekly'.")
+    if not is_valid_periodicity(periodicity):
+        print("Invalid periodicity. Please use 'daily', 'weekly', 'every_<n>_days' or 'weekdays:<mon,...,sun>'.")
         return habits
     if name in habits:
         print(f"Habit \033[1m'{name}'\033[0m already exists.")
@@ -68,10 +80,12 @@ def add_habit(habits: Dict[str, Habit], name: str, periodicity: str, data_file:
 
     habits[name] = Habit(name, periodicity)
     save_data(habits, data_file)
+    (bus or default_bus).publish(HabitAdded(name, habits[name].created_at, data_file, periodicity))
     print(f"Added habit: \033[1m{name}\033[0m with periodicity: \033[1m{periodicity}\033[0m.")
     return habits
 
-def delete_habit(habits: Dict[str, Habit], name: str, data_file: str) -> Dict[str, Habit]:
+def delete_habit(habits: Dict[str, Habit], name: str, data_file: str,
+                 bus: Optional[EventBus] = None) -> Dict[str, Habit]:
     """
     Delete a habit by its name.
 
@@ -79,6 +93,7 @@ def delete_habit(habits: Dict[str, Habit], name: str, data_file: str) -> Dict[st
         habits (Dict[str, Habit]): The current dictionary of habits.
         name (str): The name of the habit to delete.
         data_file (str): The file path for saving the data.
+        bus (EventBus, optional): The bus receiving the change events. Defaults to the shared bus.
 
     Returns:
         Dict[str, Habit]: Updated dictionary of habits with the habit removed.
@@ -86,12 +101,67 @@ def delete_habit(habits: Dict[str, Habit], name: str, data_file: str) -> Dict[st
     if name in habits:
         del habits[name]
         save_data(habits, data_file)
+        # A habit added later under the same name must not inherit the archived check-offs
+        drop_cold_history(data_file, name)
+        (bus or default_bus).publish(HabitDeleted(name, datetime.now(), data_file))
         print(f"Habit \033[1m'{name}'\033[0m has been deleted.")
     else:
         print(f"Habit \033[1m'{name}'\033[0m not found.")
     return habits
 
-def check_off_habit(habits: Dict[str, Habit], name: str, data_file: str) -> Dict[str, Habit]:
+def cold_file_path(data_file: str) -> str:
+    """
+    Return the path of the cold archive that belongs to a habits file.
+
+    Args:
+        data_file (str): The path of the habits file.
+
+    Returns:
+        str: The path of the cold archive, e.g. 'alice_habits_cold.json' for 'alice_habits.json'.
+    """
+    base, extension = os.path.splitext(data_file)
+    return f"{base}_cold{extension or '.json'}"
+
+def load_cold_archive(data_file: str) -> Dict[str, str]:
+    """
+    Load the cold archive of a habits file.
+
+    A missing archive is empty. A corrupt one raises, since treating it as empty would let the
+    next archiving run overwrite every check-off it holds.
+
+    Args:
+        data_file (str): The path of the habits file.
+
+    Returns:
+        Dict[str, str]: Habit names mapped to their encoded archived check-offs.
+
+    Raises:
+        json.JSONDecodeError: If the cold archive is corrupt.
+    """
+    try:
+        return json.loads(get_storage().read_text(cold_file_path(data_file)))
+    except FileNotFoundError:
+        return {}
+
+def drop_cold_history(data_file: str, name: str) -> None:
+    """
+    Remove a habit's archived check-offs from the cold archive of a habits file.
+
+    Args:
+        data_file (str): The path of the habits file.
+        name (str): The name of the habit.
+    """
+    try:
+        archive = load_cold_archive(data_file)
+    except json.JSONDecodeError:
+        print(f"\n\033[1mCold archive is corrupt, archived check-offs of '{name}' were kept.\033[0m")
+        return
+    if name in archive:
+        del archive[name]
+        get_storage().write_atomic(cold_file_path(data_file), json.dumps(archive, separators=(",", ":")))
+
+def check_off_habit(habits: Dict[str, Habit], name: str, data_file: str,
+                    bus: Optional[EventBus] = None) -> Dict[str, Habit]:
     """
     Mark the specified habit as completed for today.
 
@@ -99,14 +169,20 @@ def check_off_habit(habits: Dict[str, Habit], name: str, data_file: str) -> Dict
         habits (Dict[str, Habit]): The current dictionary of habits.
         name (str): The name of the habit to check off.
         data_file (str): The file path for saving the data.
+        bus (EventBus, optional): The bus receiving the change events. Defaults to the shared bus.
 
     Returns:
         Dict[str, Habit]: Updated dictionary of habits with the habit checked off.
     """
     habit = habits.get(name)
     if habit:
-        habit.check_off()
+        # Collect the events and publish them once the check-off is saved
+        pending = EventBus()
+        collected = pending.subscribe()
+        habit.check_off(pending, data_file)
         save_data(habits, data_file)
+        for event in collected.poll():
+            (bus or default_bus).publish(event)
     else:
         print(f"Habit \033[1m'{name}'\033[0m not found.")
     return habits
@@ -125,14 +201,10 @@ def longest_streak(habits: Dict[str, Habit]) -> List[Habit]:
         print("No habits to analyze.")
         return []
 
-    # Find the maximum streak value
-    max_streak = max(habit.streak for habit in habits.values())
-
-    # Find all habits with the maximum streak
-    longest_habits = [habit for habit in habits.values() if habit.streak == max_streak]
+    longest_habits = list(analytics_cache.get('longest_streak', habits, lambda: (_longest_streak(habits), None)))
 
     if longest_habits:
-        print(f"\nLongest streak: \033[1m{max_streak}\033[0m periods.")
+        print(f"\nLongest streak: \033[1m{longest_habits[0].streak}\033[0m periods.")
         habit_names = ", ".join([habit.name for habit in longest_habits])
         print(f"\nHabits with the longest streak: \033[1m{habit_names}\033[0m")
     else:
@@ -140,6 +212,16 @@ def longest_streak(habits: Dict[str, Habit]) -> List[Habit]:
 
     return longest_habits
 
+def _longest_streak(habits: Dict[str, Habit]) -> List[Habit]:
+    """
+    Compute the habits with the longest streak for `longest_streak`.
+    """
+    # Find the maximum streak value
+    max_streak = max(habit.streak for habit in habits.values())
+
+    # Find all habits with the maximum streak
+    return [habit for habit in habits.values() if habit.streak == max_streak]
+
 def current_daily_habits(habits: Dict[str, Habit]) -> List[str]:
     """
     List all habits that have a 'daily' periodicity.
@@ -150,7 +232,8 @@ def current_daily_habits(habits: Dict[str, Habit]) -> List[str]:
     Returns:
         List[str]: A list of names of daily habits.
     """
-    daily_habits = [habit.name for habit in habits.values() if habit.periodicity == 'daily']
+    daily_habits = list(analytics_cache.get(
+        'current_daily_habits', habits, lambda: (_habits_with_periodicity(habits, 'daily'), None)))
     if daily_habits:
         print(f"\nCurrent daily habits: \033[1m{', '.join(daily_habits)}\033[0m\n")
     else:
@@ -167,49 +250,142 @@ def current_weekly_habits(habits: Dict[str, Habit]) -> List[str]:
     Returns:
         List[str]: A list of names of weekly habits.
     """
-    weekly_habits = [habit.name for habit in habits.values() if habit.periodicity == 'weekly']
+    weekly_habits = list(analytics_cache.get(
+        'current_weekly_habits', habits, lambda: (_habits_with_periodicity(habits, 'weekly'), None)))
     if weekly_habits:
         print(f"\nCurrent weekly habits: \033[1m{', '.join(weekly_habits)}\033[0m\n")
     else:
         print("No weekly habits found.")
     return weekly_habits
 
-def struggled_habits_last_month(habits: Dict[str, Habit]) -> List[str]:
+def _habits_with_periodicity(habits: Dict[str, Habit], periodicity: str) -> List[str]:
+    """
+    Compute the names of the habits with a periodicity for `current_daily_habits` and `current_weekly_habits`.
+    """
+    return [habit.name for habit in habits.values() if habit.periodicity == periodicity]
+
+def struggled_habits_last_month(habits: Dict[str, Habit], now: Optional[datetime] = None) -> List[str]:
     """
     Identify habits that were missed in the last 30 days, using the `is_broken` method.
 
+    Without a reference time the result is cached until the next midnight, when the current
+    period of every habit may end, or until its oldest check-off in the window leaves the
+    30 day window, whichever comes first.
+
     Args:
         habits (Dict[str, Habit]): The current dictionary of habits.
+        now (datetime, optional): The reference time, to ask which habits were struggled with
+            in the month before a past date. Habits archived past it are left out. Defaults to
+            the current time.
 
     Returns:
         List[str]: A list of habit names that were missed during the last month.
     """
-    now = datetime.now()
+    clock = datetime.now()
+    struggled = list(analytics_cache.get(
+        'struggled_habits_last_month', habits, lambda: _struggled_habits(habits, now, clock), (now,), clock))
+
+    if struggled:
+        print(f"\nHabits struggled with last month: \033[1m{', '.join(struggled)}\033[0m\n")
+    else:
+        print("\n\033[1mNo struggled habits found last month!\033[0m\n")
+
+    return struggled
+
+def _struggled_habits(habits: Dict[str, Habit], as_of: Optional[datetime],
+                      clock: datetime) -> Tuple[List[str], Optional[datetime]]:
+    """
+    Compute the struggled habits for `struggled_habits_last_month` and the time the result expires.
+
+    Args:
+        habits (Dict[str, Habit]): The current dictionary of habits.
+        as_of (datetime, optional): The reference time, or None for the current time.
+        clock (datetime): The current time.
+
+    Returns:
+        Tuple[List[str], Optional[datetime]]: The habit names, and when the moving window makes
+        them stale, or None for a fixed reference time.
+    """
+    now = as_of or clock
     last_month = now - timedelta(days=30)
     struggled = []
+    # Period keys are day based, so whether a habit is broken can only change at midnight
+    expires_at = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
 
     for habit in habits.values():
         # Skip if the habit was created after the last 30 days
         if habit.created_at > now:
+            expires_at = min(expires_at, habit.created_at)
+            continue
+
+        # Like habit_status_as_of, skip habits whose archive summary cannot answer for that time
+        if as_of is not None and habit.archive and as_of < habit.archive.horizon:
             continue
 
         # Check if the habit is broken (missed checkoffs)
-        if habit.is_broken():
+        if habit.is_broken(as_of):
             # Ensure the habit was active in the last 30 days
-            if habit.created_at <= now and any(check >= last_month for check in habit.checkoffs):
+            in_window = [check for check in habit.checkoffs if last_month <= check <= now]
+            if habit.created_at <= now and in_window:
                 struggled.append(habit.name)
+                expires_at = min(expires_at, min(in_window) + timedelta(days=30))
 
-    if struggled:
-        print(f"\nHabits struggled with last month: \033[1m{', '.join(struggled)}\033[0m\n")
+    return struggled, (None if as_of else expires_at)
+
+def habit_status_as_of(habits: Dict[str, Habit], when: datetime) -> Dict[str, Tuple[int, bool]]:
+    """
+    Report the streak and broken status every habit had at a past date and time.
+
+    Habits archived past `when` are left out, since their summary cannot answer for that time.
+
+    Args:
+        habits (Dict[str, Habit]): The current dictionary of habits.
+        when (datetime): The reference time of the report.
+
+    Returns:
+        Dict[str, Tuple[int, bool]]: Habit names mapped to their streak and broken status at `when`.
+    """
+    status = {}
+    for habit in habits.values():
+        if habit.created_at > when:
+            continue
+        if habit.archive and when < habit.archive.horizon:
+            print(f"\n\033[1m{habit.name}\033[0m was archived before that time; see its cold history.")
+            continue
+        status[habit.name] = (habit.streak_as_of(when), habit.is_broken(when))
+
+    if status:
+        print(f"\nHabit status as of \033[1m{when.strftime('%Y-%m-%d %H:%M:%S')}\033[0m:")
+        for name, (streak, broken) in status.items():
+            print(f" - \033[1m{name}\033[0m: \033[1mStreak\033[0m: {streak}, {'broken' if broken else 'on track'}")
     else:
-        print("\n\033[1mNo struggled habits found last month!\033[0m\n")
+        print("\n\033[1mNo habits existed at that time.\033[0m\n")
 
-    return struggled
+    return status
 
 
+def format_habit(habit: Habit) -> str:
+    """
+    Format one line of the habit listing.
+
+    Args:
+        habit (Habit): The habit to describe.
+
+    Returns:
+        str: The habit's name, periodicity, streak, last check-off and creation date.
+    """
+    last_checkoff = habit.last_checkoff()
+    last_checked = last_checkoff.strftime("%Y-%m-%d %H:%M:%S") if last_checkoff else "Never"
+    return (
+        f" - \033[1m{habit.name}\033[0m ({habit.periodicity}), "
+        f"\033[1mStreak\033[0m: {habit.streak}, "
+        f"\033[1mLast Checked Off\033[0m: {last_checked}, "
+        f"\033[1mCreated At\033[0m: {habit.created_at.strftime('%Y-%m-%d %H:%M:%S')}"
+    )
+
 def view_all_habits(habits: Dict[str, Habit]) -> None:
     """
-    Display all the defined habits with their details.
+    Display all the defined habits with their details, rendered into a single write.
 
     Args:
         habits (Dict[str, Habit]): The current dictionary of habits.
@@ -217,41 +393,58 @@ def view_all_habits(habits: Dict[str, Habit]) -> None:
     if not habits:
         print("No habits defined yet.")
         return
-    
-    print("\nAll Habits:")
-    for habit in habits.values():
-        last_checked = max(habit.checkoffs) if habit.checkoffs else "Never"
-        if last_checked != "Never":
-            last_checked = last_checked.strftime("%Y-%m-%d %H:%M:%S")
-        print(
-            f" - \033[1m{habit.name}\033[0m ({habit.periodicity}), "
-            f"\033[1mStreak\033[0m: {habit.streak}, "
-            f"\033[1mLast Checked Off\033[0m: {last_checked}, "
-            f"\033[1mCreated At\033[0m: {habit.created_at.strftime('%Y-%m-%d %H:%M:%S')}"
-        )
-
-def save_data(habits: Dict[str, Habit], data_file: str) -> None:
+
+    lines = ["\nAll Habits:"]
+    lines.extend(format_habit(habit) for habit in habits.values())
+    sys.stdout.write("\n".join(lines) + "\n")
+
+def save_data(habits: Dict[str, Habit], data_file: str, compact: bool = False) -> None:
     """
     Save all habit data to a JSON file.
 
     Args:
         habits (Dict[str, Habit]): The dictionary of habits to save.
         data_file (str): The file path for saving the data.
+        compact (bool): Store check-off histories in the compressed encoding of `history_codec`
+            and write the JSON without indentation.
     """
-    data = {
-        name: {
+    data = {}
+    for name, habit in habits.items():
+        data[name] = {
             'name': habit.name,
             'periodicity': habit.periodicity,
             'created_at': habit.created_at.isoformat(),
-            'checkoffs': [check.isoformat() for check in habit.checkoffs],
             'streak': habit.streak
-        } for name, habit in habits.items()
-    }
-    with open(data_file, 'w') as f:
-        json.dump(data, f, indent=2)
+        }
+        history = None
+        if compact:
+            try:
+                history = encode_history(habit.checkoffs)
+            except ValueError:
+                pass  # Timezone aware check-offs keep the ISO format
+        if history is not None:
+            data[name]['history'] = history
+        else:
+            data[name]['checkoffs'] = [check.isoformat() for check in habit.checkoffs]
+        if habit.archive:
+            data[name]['archive'] = {
+                'horizon': habit.archive.horizon.isoformat(),
+                'count': habit.archive.count,
+                'monthly': habit.archive.monthly,
+                'runs': [list(run) for run in habit.archive.runs],
+                'longest_streak': habit.archive.longest_streak
+            }
+            if habit.archive.last_checkoff:
+                data[name]['archive']['last_checkoff'] = habit.archive.last_checkoff.isoformat()
+
+    if compact:
+        text = json.dumps(data, separators=(",", ":"))
+    else:
+        text = json.dumps(data, indent=2)
+    get_storage().write_atomic(data_file, text)
     print("\nData saved successfully.")
 
-def load_data(data_file: str) -> Dict[str, Habit]:
+def load_data(data_file: str) -> HabitSet:
     """
     Load habit data from a JSON file if it exists, or initialize a new tracker.
 
@@ -259,22 +452,38 @@ def load_data(data_file: str) -> Dict[str, Habit]:
         data_file (str): The file path for loading the data.
 
     Returns:
-        Dict[str, Habit]: A dictionary of habits loaded from the file or an empty dictionary.
+        HabitSet: A versioned dictionary of habits loaded from the file, or an empty one.
     """
-    habits: Dict[str, Habit] = {}
-    if os.path.exists(data_file):
+    habits = HabitSet()
+    storage = get_storage()
+    if storage.exists(data_file):
         try:
-            with open(data_file, 'r') as f:
-                data = json.load(f)
-                for habit_data in data.values():
-                    habit = Habit(
-                        name=habit_data['name'],
-                        periodicity=habit_data['periodicity'],
-                        created_at=datetime.fromisoformat(habit_data['created_at']),
-                        checkoffs=[datetime.fromisoformat(date) for date in habit_data['checkoffs']],
-                        streak=habit_data['streak']
+            data = json.loads(storage.read_text(data_file))
+            for habit_data in data.values():
+                if 'history' in habit_data:
+                    checkoffs = decode_history(habit_data['history'])
+                else:
+                    checkoffs = [datetime.fromisoformat(date) for date in habit_data['checkoffs']]
+                archive = None
+                if 'archive' in habit_data:
+                    archive = HistorySummary(
+                        horizon=datetime.fromisoformat(habit_data['archive']['horizon']),
+                        count=habit_data['archive']['count'],
+                        monthly=habit_data['archive']['monthly'],
+                        runs=[tuple(run) for run in habit_data['archive']['runs']],
+                        longest_streak=habit_data['archive']['longest_streak']
                     )
-                    habits[habit.name] = habit
+                    if 'last_checkoff' in habit_data['archive']:
+                        archive.last_checkoff = datetime.fromisoformat(habit_data['archive']['last_checkoff'])
+                habit = Habit(
+                    name=habit_data['name'],
+                    periodicity=habit_data['periodicity'],
+                    created_at=datetime.fromisoformat(habit_data['created_at']),
+                    checkoffs=checkoffs,
+                    streak=habit_data['streak'],
+                    archive=archive
+                )
+                habits[habit.name] = habit
             print("\n\033[1mData loaded successfully.\033[0m\n")
         except json.JSONDecodeError:
             print("\n\033[1mError loading data.\033[0m\n")
@@ -0,0 +1,214 @@
+import sys
+import json
+import base64
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+from habit import Habit
+from habit_tracker import format_habit
+from events import EventBus, HabitAdded, HabitDeleted, HabitEvent, default_bus
+
+
+# Each ordering maps a habit to a sort value and says whether that value is a datetime
+ORDERS: Dict[str, Tuple[Callable[[Habit], object], bool]] = {
+    'name': (lambda habit: habit.name, False),
+    'streak': (lambda habit: habit.streak, False),
+    'last_checked': (lambda habit: habit.last_checkoff() or datetime.min, True),
+    'created_at': (lambda habit: habit.created_at, True),
+}
+
+
+class HabitListing:
+    """
+    Keeps a user's habits sorted by name, streak, last check-off and creation date, and returns
+    them one page at a time.
+
+    The orderings are sorted lists of (value, name) keys that are updated from habit change
+    events, so a mutation costs O(log n) comparisons per ordering instead of a full re-sort.
+
+    Methods:
+    -------
+    page(order: str, limit: int, cursor: str, descending: bool) -> Tuple[List[Habit], Optional[str]]
+        Return one page of habits and the cursor of the next page.
+    refresh(name: str) -> None
+        Re-position a habit in every ordering after it changed.
+    rebuild() -> None
+        Re-sort every ordering from scratch after untracked bulk changes.
+    close() -> None
+        Stop following habit change events.
+    """
+    def __init__(self, habits: Dict[str, Habit], bus: Optional[EventBus] = None,
+                 data_file: Optional[str] = None) -> None:
+        """
+        Builds the orderings and subscribes to habit change events.
+
+        Args:
+            habits (Dict[str, Habit]): The dictionary of habits to list. Mutations made through
+                `add_habit`, `delete_habit` and `check_off_habit` are followed automatically.
+            bus (EventBus, optional): The bus the mutations are published on. Defaults to the shared bus.
+            data_file (str, optional): The habits file of the user. When set, only events about
+                this file are applied, so other users' habits of the same name are ignored.
+        """
+        self.habits = habits
+        self.bus = bus or default_bus
+        self.data_file = data_file
+        self.orderings: Dict[str, List[Tuple[object, str]]] = {}
+        self.keys: Dict[str, Dict[str, Tuple[object, str]]] = {}
+        self.rebuild()
+        self.subscription = self.bus.subscribe(self.apply)
+
+    def rebuild(self) -> None:
+        """
+        Re-sort every ordering from scratch after untracked bulk changes.
+        """
+        self.keys = {name: self._keys(habit) for name, habit in self.habits.items()}
+        self.orderings = {order: sorted(keys[order] for keys in self.keys.values()) for order in ORDERS}
+
+    def _keys(self, habit: Habit) -> Dict[str, Tuple[object, str]]:
+        """
+        Return the sort key of a habit in every ordering.
+        """
+        return {order: (value(habit), habit.name) for order, (value, _) in ORDERS.items()}
+
+    def refresh(self, name: str) -> None:
+        """
+        Re-position a habit in every ordering after it changed, or drop it if it was deleted.
+
+        Args:
+            name (str): The name of the habit.
+        """
+        old_keys = self.keys.pop(name, None)
+        if old_keys:
+            for order, key in old_keys.items():
+                ordering = self.orderings[order]
+                del ordering[bisect_left(ordering, key)]
+
+        habit = self.habits.get(name)
+        if habit is not None:
+            self.keys[name] = self._keys(habit)
+            for order, key in self.keys[name].items():
+                insort(self.orderings[order], key)
+
+    def apply(self, events: List[HabitEvent]) -> None:
+        """
+        Update the orderings from a batch of habit change events.
+
+        Events about habits of another dictionary are ignored: they must name the habits file of
+        the listing if it has one, a name that was added must be in this dictionary, and a name
+        that was deleted must be missing from it.
+
+        Args:
+            events (List[HabitEvent]): The events to apply.
+        """
+        for event in events:
+            if self.data_file is not None and event.data_file != self.data_file:
+                continue
+            if isinstance(event, HabitAdded) and event.name not in self.habits:
+                continue
+            if isinstance(event, HabitDeleted) and event.name in self.habits:
+                continue
+            if event.name in self.habits or event.name in self.keys:
+                self.refresh(event.name)
+
+    def close(self) -> None:
+        """
+        Stop following habit change events.
+        """
+        self.bus.unsubscribe(self.subscription)
+
+    def page(self, order: str = 'name', limit: int = 20, cursor: Optional[str] = None,
+             descending: bool = False) -> Tuple[List[Habit], Optional[str]]:
+        """
+        Return one page of habits in the requested order.
+
+        Cursors remember the sort key of the last habit on the page rather than a position, so
+        paging stays consistent while habits are added, deleted or checked off in between.
+
+        Args:
+            order (str): 'name', 'streak', 'last_checked' or 'created_at'.
+            limit (int): The maximum number of habits on the page.
+            cursor (str, optional): The cursor returned with the previous page. Omit for the first page.
+            descending (bool): List the highest values first.
+
+        Returns:
+            Tuple[List[Habit], Optional[str]]: The habits on the page and the cursor of the next
+            page, or None if this is the last page.
+        """
+        if order not in ORDERS:
+            raise ValueError(f"Invalid order. Please use one of: {', '.join(ORDERS)}.")
+
+        ordering = self.orderings[order]
+        if cursor is None:
+            start = len(ordering) - 1 if descending else 0
+        else:
+            key = self._decode_cursor(cursor, order, descending)
+            start = bisect_left(ordering, key) - 1 if descending else bisect_right(ordering, key)
+
+        if descending:
+            keys = ordering[max(start - limit + 1, 0):start + 1][::-1]
+            more = start - limit >= 0
+        else:
+            keys = ordering[start:start + limit]
+            more = start + limit < len(ordering)
+
+        habits = [self.habits[name] for _, name in keys]
+        next_cursor = self._encode_cursor(keys[-1], order, descending) if keys and more else None
+        return habits, next_cursor
+
+    def _encode_cursor(self, key: Tuple[object, str], order: str, descending: bool) -> str:
+        """
+        Encode the sort key of the last habit on a page as an opaque cursor.
+        """
+        value, name = key
+        if ORDERS[order][1]:
+            value = value.isoformat()
+        data = json.dumps([order, descending, value, name], separators=(",", ":"))
+        return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+    def _decode_cursor(self, cursor: str, order: str, descending: bool) -> Tuple[object, str]:
+        """
+        Decode a cursor back into the sort key it was created from.
+        """
+        try:
+            cursor_order, cursor_descending, value, name = json.loads(base64.urlsafe_b64decode(cursor))
+        except (ValueError, TypeError):
+            raise ValueError("Invalid cursor.") from None
+        if (cursor_order, cursor_descending) != (order, descending):
+            raise ValueError("The cursor belongs to a different order.")
+        if ORDERS[order][1]:
+            value = datetime.fromisoformat(value)
+        return value, name
+
+
+def render_page(habits: List[Habit], page_number: int = 1, more: bool = False) -> str:
+    """
+    Render a page of habits into one string, so it can be written to the terminal at once.
+
+    Args:
+        habits (List[Habit]): The habits on the page.
+        page_number (int): The number of the page, shown in the header.
+        more (bool): Whether another page follows.
+
+    Returns:
+        str: The rendered page.
+    """
+    if not habits:
+        return "No habits defined yet.\n"
+    lines = [f"\nAll Habits (page {page_number}):"]
+    lines.extend(format_habit(habit) for habit in habits)
+    if more:
+        lines.append("\033[1mPress Enter for the next page or 'q' to stop.\033[0m")
+    return "\n".join(lines) + "\n"
+
+
+def write_page(habits: List[Habit], page_number: int = 1, more: bool = False) -> None:
+    """
+    Write a rendered page of habits to the terminal in a single buffered write.
+
+    Args:
+        habits (List[Habit]): The habits on the page.
+        page_number (int): The number of the page, shown in the header.
+        more (bool): Whether another page follows.
+    """
+    sys.stdout.write(render_page(habits, page_number, more))
+    sys.stdout.flush()
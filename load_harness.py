@@ -0,0 +1,285 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Tuple
+from habit_tracker import add_habit, check_off_habit, save_data, load_data
+from sharding import load_manifest
+from user_conn import UserConn
+
+
+Latencies = Dict[str, List[float]]
+
+CONNECT_RETRIES = 5
+CONNECT_BACKOFF = 0.01  # Seconds before the first retry, doubled after every failed attempt
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """
+    Return the nearest-rank percentile of a sorted list of values.
+
+    Args:
+        values (List[float]): The values in ascending order.
+        pct (float): The percentile between 0 and 100.
+
+    Returns:
+        float: The percentile value, or 0.0 for an empty list.
+    """
+    if not values:
+        return 0.0
+    rank = max(1, -(-len(values) * pct // 100))  # ceil without floats
+    return values[int(rank) - 1]
+
+
+def timed(latencies: Latencies, errors: Dict[str, int], operation: str, func, *args):
+    """
+    Run an operation, recording its latency, or counting it as an error if it raises.
+
+    Returns:
+        The result of the operation, or None if it raised.
+    """
+    start = time.perf_counter()
+    try:
+        result = func(*args)
+    except Exception:
+        errors[operation] += 1
+        return None
+    latencies[operation].append(time.perf_counter() - start)
+    return result
+
+
+def shared_habit(worker_id: str) -> str:
+    """
+    Return the name of the habit a worker adds to every shared user.
+    """
+    return f"{worker_id} habit"
+
+
+def run_worker(worker_id: str, users_file: str, data_directory: str, layout: str,
+               users: int, habits: int, shared_users: List[str]) -> Tuple[Latencies, Dict[str, int]]:
+    """
+    Register, log in and check off habits for a batch of users, timing every operation.
+
+    Afterwards the worker logs into every shared user and adds and checks off a habit of its own,
+    so all workers write to the same habits files concurrently.
+
+    Args:
+        worker_id (str): A prefix that makes this worker's usernames unique.
+        users_file (str): The shared users file.
+        data_directory (str): The shared data directory.
+        layout (str): The data directory layout passed to UserConn.
+        users (int): The number of users this worker creates.
+        habits (int): The number of habits checked off per user.
+        shared_users (List[str]): Users registered up front that every worker writes to.
+
+    Returns:
+        Tuple[Latencies, Dict[str, int]]: The latencies in seconds and error counts per operation.
+    """
+    latencies: Latencies = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    conn = None
+    for attempt in range(CONNECT_RETRIES):
+        # The users file can be caught mid-write by another worker
+        conn = timed(latencies, errors, "connect", UserConn, users_file, data_directory, layout)
+        if conn is not None:
+            break
+        time.sleep(CONNECT_BACKOFF * 2 ** attempt)
+    else:
+        errors["connect_failed"] += 1
+        return dict(latencies), dict(errors)
+
+    for index in range(users):
+        username = f"{worker_id}_user{index}"
+        timed(latencies, errors, "register_user", conn.register_user, username, "secret")
+        if not timed(latencies, errors, "login_user", conn.login_user, username, "secret"):
+            errors["login_failed"] += 1
+            continue
+
+        habits_file = conn.habits_file(username)
+        for number in range(habits):
+            timed(latencies, errors, "add_habit", add_habit, conn.habits, f"Habit {number}", "daily", habits_file)
+            timed(latencies, errors, "check_off_habit", check_off_habit, conn.habits, f"Habit {number}", habits_file)
+
+        timed(latencies, errors, "save_data", save_data, conn.habits, habits_file)
+        timed(latencies, errors, "record_user", conn.record_habits_file, username)
+        timed(latencies, errors, "load_data", load_data, habits_file)
+
+    for username in shared_users:
+        if not timed(latencies, errors, "login_user", conn.login_user, username, "secret"):
+            errors["login_failed"] += 1
+            continue
+
+        habits_file = conn.habits_file(username)
+        name = shared_habit(worker_id)
+        timed(latencies, errors, "add_habit", add_habit, conn.habits, name, "daily", habits_file)
+        timed(latencies, errors, "check_off_habit", check_off_habit, conn.habits, name, habits_file)
+        timed(latencies, errors, "save_data", save_data, conn.habits, habits_file)
+        timed(latencies, errors, "record_user", conn.record_habits_file, username)
+
+    return dict(latencies), dict(errors)
+
+
+def run_process(args: Tuple) -> Tuple[Latencies, Dict[str, int]]:
+    """
+    Run a process worker with its threads, returning their merged results.
+    """
+    process_id, threads, users_file, data_directory, layout, users, habits, shared_users = args
+    sys.stdout = open(os.devnull, 'w')
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = [
+            pool.submit(run_worker, f"p{process_id}t{thread}", users_file, data_directory, layout, users, habits,
+                        shared_users)
+            for thread in range(threads)
+        ]
+        return merge_results([future.result() for future in futures])
+
+
+def merge_results(results: List[Tuple[Latencies, Dict[str, int]]]) -> Tuple[Latencies, Dict[str, int]]:
+    """
+    Merge the latencies and error counts of several workers.
+    """
+    latencies: Latencies = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    for worker_latencies, worker_errors in results:
+        for operation, values in worker_latencies.items():
+            latencies[operation].extend(values)
+        for operation, count in worker_errors.items():
+            errors[operation] += count
+    return dict(latencies), dict(errors)
+
+
+def check_integrity(users_file: str, data_directory: str, layout: str, usernames: List[str],
+                    habits: int, shared_users: List[str], worker_ids: List[str]) -> Dict[str, int]:
+    """
+    Verify that every registration and check-off made it to disk intact.
+
+    With the sharded layout the manifest is also checked against the files on disk: every user
+    needs an entry pointing at their habits file with its current size.
+
+    Args:
+        users_file (str): The shared users file.
+        data_directory (str): The shared data directory.
+        layout (str): The data directory layout.
+        usernames (List[str]): All usernames the workers registered.
+        habits (int): The number of habits checked off per user.
+        shared_users (List[str]): The users every worker wrote to.
+        worker_ids (List[str]): The ids of all workers, naming their habits of the shared users.
+
+    Returns:
+        Dict[str, int]: Counts of corrupted and missing files, lost registrations, lost habits and
+        check-offs, habits of shared users lost to concurrent writers, and manifest entries that are
+        missing, point at the wrong file or record a stale size.
+    """
+    problems = {"corrupted_json": 0, "missing_files": 0, "lost_users": 0, "lost_habits": 0, "lost_checkoffs": 0,
+                "lost_shared_habits": 0, "missing_entries": 0, "wrong_paths": 0, "stale_sizes": 0}
+    try:
+        with open(users_file, 'r') as f:
+            registered = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        problems["corrupted_json"] += 1
+        registered = {}
+
+    conn = UserConn(users_file=users_file, data_directory=data_directory, layout=layout)
+    manifest = load_manifest(data_directory) if layout == "sharded" else {}
+    for username in usernames + shared_users:
+        if username not in registered:
+            problems["lost_users"] += 1
+        habits_file = conn.habits_file(username)
+        try:
+            with open(habits_file, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            problems["missing_files"] += 1
+            continue
+        except json.JSONDecodeError:
+            problems["corrupted_json"] += 1
+            continue
+
+        if layout == "sharded":
+            if username not in manifest:
+                problems["missing_entries"] += 1
+            else:
+                path, size = manifest[username]
+                if os.path.join(data_directory, path) != habits_file:
+                    problems["wrong_paths"] += 1
+                elif size != os.path.getsize(habits_file):
+                    problems["stale_sizes"] += 1
+
+        if username in shared_users:
+            problems["lost_shared_habits"] += sum(1 for worker_id in worker_ids if shared_habit(worker_id) not in data)
+        else:
+            problems["lost_habits"] += habits - len(data)
+        problems["lost_checkoffs"] += sum(1 for habit in data.values() if not habit.get('checkoffs'))
+    return problems
+
+
+def main():
+    """
+    Drive UserConn and the persistence functions from many threads and processes and report
+    throughput, latency percentiles and data integrity errors.
+    """
+    parser = argparse.ArgumentParser(description="Concurrent load and latency harness for HabitTracker storage.")
+    parser.add_argument("--processes", type=int, default=2, help="worker processes")
+    parser.add_argument("--threads", type=int, default=4, help="threads per process")
+    parser.add_argument("--users", type=int, default=10, help="users registered per thread")
+    parser.add_argument("--habits", type=int, default=5, help="habits checked off per user")
+    parser.add_argument("--shared-users", type=int, default=1, help="users every worker writes to concurrently")
+    parser.add_argument("--layout", choices=["flat", "sharded"], default="flat", help="data directory layout")
+    parser.add_argument("--directory", help="data directory to use instead of a temporary one")
+    args = parser.parse_args()
+
+    data_directory = args.directory or tempfile.mkdtemp(prefix="habit_load_")
+    users_file = os.path.join(data_directory, "users.json")
+    shared_users = [f"shared_user{index}" for index in range(args.shared_users)]
+    jobs = [
+        (process, args.threads, users_file, data_directory, args.layout, args.users, args.habits, shared_users)
+        for process in range(args.processes)
+    ]
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    conn = UserConn(users_file=users_file, data_directory=data_directory, layout=args.layout)
+    for username in shared_users:
+        conn.register_user(username, "secret")
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=args.processes) as pool:
+            latencies, errors = merge_results(list(pool.map(run_process, jobs)))
+    finally:
+        elapsed = time.perf_counter() - start
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    worker_ids = [f"p{process}t{thread}" for process in range(args.processes) for thread in range(args.threads)]
+    usernames = [f"{worker_id}_user{index}" for worker_id in worker_ids for index in range(args.users)]
+    problems = check_integrity(users_file, data_directory, args.layout, usernames, args.habits,
+                               shared_users, worker_ids)
+
+    workers = args.processes * args.threads
+    print(f"\n\033[1mLoad test\033[0m: {args.processes} processes x {args.threads} threads, "
+          f"{len(usernames)} users, {len(shared_users)} shared, {args.layout} layout, {elapsed:.2f}s\n")
+    print(f"{'operation':<16}{'count':>8}{'errors':>8}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for operation in ["connect", "register_user", "login_user", "add_habit", "check_off_habit", "save_data",
+                      "record_user", "load_data"]:
+        values = sorted(latencies.get(operation, []))
+        print(f"{operation:<16}{len(values):>8}{errors.get(operation, 0):>8}{len(values) / elapsed:>10.1f}"
+              f"{percentile(values, 50) * 1000:>10.2f}{percentile(values, 95) * 1000:>10.2f}"
+              f"{percentile(values, 99) * 1000:>10.2f}")
+
+    print(f"\n\033[1mIntegrity\033[0m ({workers} concurrent workers):")
+    print(f"  {'failed connects:':<20}{errors.get('connect_failed', 0)}")
+    print(f"  {'failed logins:':<20}{errors.get('login_failed', 0)}")
+    for problem, count in problems.items():
+        print(f"  {problem.replace('_', ' ') + ':':<20}{count}")
+
+    if not args.directory:
+        shutil.rmtree(data_directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,8 +8,28 @@ from habit_tracker import (
     current_daily_habits,
     current_weekly_habits,
     struggled_habits_last_month,
-    view_all_habits,
 )
+from listing import HabitListing, ORDERS, write_page
+
+
+def browse_habits(listing: HabitListing, order: str = 'name', page_size: int = 20) -> None:
+    """
+    Display the habits one page at a time, each page rendered in a single write.
+
+    Args:
+        listing (HabitListing): The sorted habit listing of the current user.
+        order (str): The ordering to page through.
+        page_size (int): The number of habits per page.
+    """
+    descending = order in ('streak', 'last_checked')
+    habits, cursor = listing.page(order, page_size, descending=descending)
+    page_number = 1
+    write_page(habits, page_number, more=cursor is not None)
+
+    while cursor and input().strip().lower() != 'q':
+        habits, cursor = listing.page(order, page_size, cursor, descending=descending)
+        page_number += 1
+        write_page(habits, page_number, more=cursor is not None)
 
 
 def main():
@@ -73,18 +93,20 @@ def main():
         elif choice == '4':
             if tracker.current_user:
                 name = input("Enter habit name: ")
-                periodicity = input("Enter periodicity ('daily' or 'weekly'): ")
-                habits_file = os.path.join(current_directory, f"{tracker.current_user}_habits.json")
+                periodicity = input("Enter periodicity ('daily', 'weekly', 'every_<n>_days' or 'weekdays:<mon,...,sun>'): ")
+                habits_file = tracker.habits_file(tracker.current_user)
                 tracker.habits = add_habit(tracker.habits, name, periodicity, habits_file)
+                tracker.record_habits_file(tracker.current_user)
             else:
                 print("\n\033[1mPlease login to add a habit.\033[0m\n")
 
         elif choice == '5':
             if tracker.current_user:
-                view_all_habits(tracker.habits)
+                browse_habits(tracker.listing)
                 name = input("\nEnter habit name to check off: ")
-                habits_file = os.path.join(current_directory, f"{tracker.current_user}_habits.json")
+                habits_file = tracker.habits_file(tracker.current_user)
                 tracker.habits = check_off_habit(tracker.habits, name, habits_file)
+                tracker.record_habits_file(tracker.current_user)
             else:
                 print("\n\033[1mPlease login to check off a habit.\033[0m\n")
 
@@ -114,15 +136,20 @@ def main():
 
         elif choice == '10':
             if tracker.current_user:
-                view_all_habits(tracker.habits)
+                order = input(f"Sort by ({', '.join(ORDERS)}) [name]: ").strip() or 'name'
+                if order in ORDERS:
+                    browse_habits(tracker.listing, order)
+                else:
+                    print("\n\033[1mInvalid sort order.\033[0m\n")
             else:
                 print("\n\033[1mPlease login to view all your habits.\033[0m\n")
 
         elif choice == '11':
             if tracker.current_user:
                 name = input("Enter habit name to delete: ")
-                habits_file = os.path.join(current_directory, f"{tracker.current_user}_habits.json")
+                habits_file = tracker.habits_file(tracker.current_user)
                 tracker.habits = delete_habit(tracker.habits, name, habits_file)
+                tracker.record_habits_file(tracker.current_user)
             else:
                 print("\n\033[1mPlease login to delete a habit.\033[0m\n")
 
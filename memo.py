@@ -0,0 +1,129 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+
+class AnalyticsCache:
+    """
+    A bounded LRU cache of analytics results, keyed by the version of the habits they were
+    computed from.
+
+    Results are only cached for a `HabitSet` or a snapshot, whose version changes with every
+    mutation of the set or of a habit in it, so a stale entry is never found again and simply
+    ages out. Results that also depend on the clock carry an expiry time after which they are
+    recomputed.
+
+    Attributes:
+        maxsize (int): The maximum number of cached results.
+        hits (int): Lookups answered from the cache.
+        misses (int): Lookups that had to compute the result.
+        expired (int): Misses caused by an entry that outlived its expiry time.
+        bypassed (int): Computations over plain dictionaries, which are never cached.
+
+    Methods:
+    -------
+    get(analytic: str, habits, compute, args, now) -> object
+        Return the cached result of an analytic, computing and caching it on a miss.
+    stats() -> Dict[str, float]
+        Return the cache counters and the hit rate.
+    clear() -> None
+        Drop all cached results and reset the counters.
+    """
+    def __init__(self, maxsize: int = 128) -> None:
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1.")
+        self.maxsize = maxsize
+        self.entries: "OrderedDict[Hashable, Tuple[object, Optional[datetime]]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.bypassed = 0
+
+    @staticmethod
+    def key(analytic: str, habits, args: Tuple = ()) -> Optional[Hashable]:
+        """
+        Return the cache key of an analytic over a set of habits, or None if it cannot be cached.
+
+        Args:
+            analytic (str): The name of the analytic.
+            habits (Dict[str, Habit]): The habits it is computed from.
+            args (Tuple): Further hashable arguments of the analytic.
+
+        Returns:
+            Hashable, optional: The key, or None for plain dictionaries, which carry no version.
+        """
+        version = getattr(habits, 'version', None)
+        if version is None:
+            return None
+        return analytic, habits.uid, version, args
+
+    def get(self, analytic: str, habits, compute: Callable[[], Tuple[object, Optional[datetime]]],
+            args: Tuple = (), now: Optional[datetime] = None) -> object:
+        """
+        Return the cached result of an analytic, computing and caching it on a miss.
+
+        Args:
+            analytic (str): The name of the analytic.
+            habits (Dict[str, Habit]): The habits it is computed from.
+            compute (Callable): Computes the result and the time it expires at, or None if it
+                only depends on the habits.
+            args (Tuple): Further hashable arguments of the analytic.
+            now (datetime, optional): The time the expiry is checked against. Defaults to the current time.
+
+        Returns:
+            object: The result of the analytic.
+        """
+        key = self.key(analytic, habits, args)
+        if key is None:
+            with self.lock:
+                self.bypassed += 1
+            return compute()[0]
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                result, expires_at = entry
+                if expires_at is None or (now or datetime.now()) < expires_at:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return result
+                del self.entries[key]
+                self.expired += 1
+            self.misses += 1
+
+        result, expires_at = compute()
+        with self.lock:
+            self.entries[key] = (result, expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return result
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Return the cache counters.
+
+        Returns:
+            Dict[str, float]: The hits, misses, expired entries, bypassed computations, current
+            size and the hit rate of cacheable lookups.
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'expired': self.expired,
+                'bypassed': self.bypassed,
+                'size': len(self.entries),
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def clear(self) -> None:
+        """
+        Drop all cached results and reset the counters.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = self.expired = self.bypassed = 0
@@ -0,0 +1,114 @@
+import re
+from bisect import bisect_right
+from datetime import datetime
+from functools import lru_cache
+from typing import Callable, Tuple
+
+
+WEEKDAY_NAMES = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+EVERY_N_DAYS = re.compile(r"every_(\d+)_days")
+
+
+@lru_cache(maxsize=None)
+def key_function(periodicity: str) -> Callable[[datetime], int]:
+    """
+    Build the function that maps a timestamp to the integer key of its period.
+
+    Keys of consecutive periods are consecutive integers, so two check-offs fall into the same
+    period when their keys are equal and into adjacent periods when their keys differ by one.
+    Supported periodicities are 'daily', 'weekly' (ISO weeks starting on Monday),
+    'every_<n>_days' and 'weekdays:<day>,<day>,...' with days named 'mon' to 'sun'.
+
+    Args:
+        periodicity (str): The frequency of the habit.
+
+    Returns:
+        Callable[[datetime], int]: The period key function.
+
+    Raises:
+        ValueError: If the periodicity is not supported.
+    """
+    if periodicity == 'daily':
+        return lambda when: when.toordinal()
+    if periodicity == 'weekly':
+        # Ordinal 1 (0001-01-01) is a Monday, so this counts ISO weeks across years
+        return lambda when: (when.toordinal() - 1) // 7
+
+    match = EVERY_N_DAYS.fullmatch(periodicity)
+    if match and int(match.group(1)) > 0:
+        days = int(match.group(1))
+        return lambda when: when.toordinal() // days
+
+    if periodicity.startswith('weekdays:'):
+        schedule = _parse_weekdays(periodicity[len('weekdays:'):])
+        per_week = len(schedule)
+
+        def scheduled_key(when: datetime) -> int:
+            # Each scheduled weekday is one period; other days count towards the previous one
+            week, weekday = divmod(when.toordinal() - 1, 7)
+            return week * per_week + bisect_right(schedule, weekday) - 1
+
+        return scheduled_key
+
+    raise ValueError(f"Unsupported periodicity: {periodicity!r}")
+
+
+def _parse_weekdays(days: str) -> Tuple[int, ...]:
+    """
+    Parse a comma separated list of weekday names into sorted weekday numbers.
+
+    Args:
+        days (str): Weekday names such as 'mon,wed,fri'.
+
+    Returns:
+        Tuple[int, ...]: The sorted weekday numbers, Monday being 0.
+    """
+    try:
+        schedule = sorted({WEEKDAY_NAMES.index(day.strip().lower()) for day in days.split(',')})
+    except ValueError:
+        raise ValueError(f"Unsupported weekdays: {days!r}") from None
+    return tuple(schedule)
+
+
+def period_key(periodicity: str, when: datetime) -> int:
+    """
+    Map a timestamp to the integer key of its period.
+
+    Args:
+        periodicity (str): The frequency of the habit.
+        when (datetime): The timestamp to map.
+
+    Returns:
+        int: The period key.
+    """
+    return key_function(periodicity)(when)
+
+
+def is_valid_periodicity(periodicity: str) -> bool:
+    """
+    Check whether a periodicity is supported.
+
+    Args:
+        periodicity (str): The frequency to check.
+
+    Returns:
+        bool: True if the periodicity is supported, False otherwise.
+    """
+    try:
+        key_function(periodicity)
+    except ValueError:
+        return False
+    return True
+
+
+def period_name(periodicity: str) -> str:
+    """
+    Describe a single period of a periodicity in words.
+
+    Args:
+        periodicity (str): The frequency of the habit.
+
+    Returns:
+        str: 'day', 'week' or 'period'.
+    """
+    return {'daily': 'day', 'weekly': 'week'}.get(periodicity, 'period')
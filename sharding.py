@@ -0,0 +1,202 @@
+import os
+import json
+import hashlib
+from typing import Dict, List, Optional, Tuple
+from storage import get_storage
+from habit_tracker import cold_file_path
+
+
+MANIFEST_NAME = "manifest.json"
+JOURNAL_NAME = "manifest.log"
+LOCK_NAME = "manifest.lock"
+JOURNAL_COMPACT_BYTES = 1 << 20
+HABITS_SUFFIX = "_habits.json"
+
+
+def shard_path(data_directory: str, username: str, depth: int = 2) -> str:
+    """
+    Compute the sharded location of a user's habits file.
+
+    The username is hashed and the first `depth` byte pairs of the digest become nested
+    directories, so no single directory grows beyond 256 entries per level.
+
+    Args:
+        data_directory (str): The root directory of the sharded layout.
+        username (str): The user whose habits file is located.
+        depth (int): The number of shard directory levels.
+
+    Returns:
+        str: The absolute path of the user's habits file.
+    """
+    digest = hashlib.sha1(username.encode("utf-8")).hexdigest()
+    shards = [digest[i * 2:i * 2 + 2] for i in range(depth)]
+    return os.path.join(data_directory, *shards, f"{username}{HABITS_SUFFIX}")
+
+
+def _manifest_paths(data_directory: str) -> Tuple[str, str, str]:
+    """
+    Return the paths of the compacted manifest, its journal and its lock file.
+    """
+    return (
+        os.path.join(data_directory, MANIFEST_NAME),
+        os.path.join(data_directory, JOURNAL_NAME),
+        os.path.join(data_directory, LOCK_NAME),
+    )
+
+
+def _read_manifest(data_directory: str) -> Dict[str, Tuple[str, int]]:
+    """
+    Read the compacted manifest and replay its journal. The caller must hold the manifest lock.
+    """
+    manifest_file, journal_file, _ = _manifest_paths(data_directory)
+    storage = get_storage()
+    try:
+        data = json.loads(storage.read_text(manifest_file))
+    except FileNotFoundError:
+        data = {}
+    manifest = {username: (entry[0], entry[1]) for username, entry in data.get("users", {}).items()}
+
+    try:
+        journal = storage.read_text(journal_file)
+    except FileNotFoundError:
+        journal = ""
+    for line in journal.splitlines(keepends=True):
+        if not line.endswith("\n"):
+            break  # An entry cut short by a crash
+        username, path, size = json.loads(line)
+        manifest[username] = (path, size)
+    return manifest
+
+
+def _write_manifest(data_directory: str, manifest: Dict[str, Tuple[str, int]]) -> None:
+    """
+    Write a compacted manifest and empty the journal. The caller must hold the manifest lock.
+    """
+    manifest_file, journal_file, _ = _manifest_paths(data_directory)
+    storage = get_storage()
+    data = {"version": 1, "users": {username: list(entry) for username, entry in manifest.items()}}
+    storage.write_atomic(manifest_file, json.dumps(data, separators=(",", ":")))
+    storage.write_text(journal_file, "")
+
+
+def _append_entry(data_directory: str, username: str, habits_file: str, size: int) -> Tuple[str, int]:
+    """
+    Append a user's entry to the manifest journal. The caller must hold the manifest lock.
+
+    Returns:
+        Tuple[str, int]: The relative shard path and size that were recorded.
+    """
+    path = os.path.relpath(habits_file, data_directory)
+    line = json.dumps([username, path, size], separators=(",", ":")) + "\n"
+    get_storage().append_text(_manifest_paths(data_directory)[1], line)
+    return path, size
+
+
+def load_manifest(data_directory: str) -> Dict[str, Tuple[str, int]]:
+    """
+    Load the user manifest of a sharded data directory.
+
+    Args:
+        data_directory (str): The root directory of the sharded layout.
+
+    Returns:
+        Dict[str, Tuple[str, int]]: Usernames mapped to their relative shard path and file size.
+    """
+    with get_storage().lock(_manifest_paths(data_directory)[2]):
+        return _read_manifest(data_directory)
+
+
+def save_manifest(data_directory: str, manifest: Dict[str, Tuple[str, int]]) -> None:
+    """
+    Replace the user manifest of a sharded data directory.
+
+    The manifest is written compactly to a uniquely named temporary file and moved into place
+    under the manifest lock, so readers never observe a partially written manifest.
+
+    Args:
+        data_directory (str): The root directory of the sharded layout.
+        manifest (Dict[str, Tuple[str, int]]): Usernames mapped to relative shard path and size.
+    """
+    with get_storage().lock(_manifest_paths(data_directory)[2]):
+        _write_manifest(data_directory, manifest)
+
+
+def record_user(data_directory: str, username: str, depth: int = 2) -> None:
+    """
+    Add or refresh a user's entry in the manifest using the current size of their habits file.
+
+    The entry is appended to the manifest journal under the manifest lock, so concurrent
+    registrations never lose each other's entries and a write costs O(1). The journal is
+    folded into the compacted manifest once it grows past JOURNAL_COMPACT_BYTES.
+
+    Args:
+        data_directory (str): The root directory of the sharded layout.
+        username (str): The user to record.
+        depth (int): The number of shard directory levels.
+    """
+    habits_file = shard_path(data_directory, username, depth)
+    _, journal_file, lock_file = _manifest_paths(data_directory)
+    storage = get_storage()
+    with storage.lock(lock_file):
+        size = storage.getsize(habits_file) if storage.exists(habits_file) else 0
+        _append_entry(data_directory, username, habits_file, size)
+        if storage.getsize(journal_file) > JOURNAL_COMPACT_BYTES:
+            _write_manifest(data_directory, _read_manifest(data_directory))
+
+
+def list_users(data_directory: str) -> List[str]:
+    """
+    List all users of a sharded data directory from its manifest, without scanning the shards.
+
+    Args:
+        data_directory (str): The root directory of the sharded layout.
+
+    Returns:
+        List[str]: The usernames recorded in the manifest, sorted alphabetically.
+    """
+    return sorted(load_manifest(data_directory))
+
+
+def migrate_flat_layout(source_directory: str, data_directory: Optional[str] = None, depth: int = 2) -> int:
+    """
+    Move every `<username>_habits.json` from a flat directory into the sharded layout, together
+    with its cold archive `<username>_habits_cold.json`.
+
+    Every moved file is journaled right away and files already present in the manifest are
+    skipped, so an interrupted migration can be resumed by running it again.
+
+    Args:
+        source_directory (str): The flat directory holding the habits files.
+        data_directory (str, optional): The root of the sharded layout. Defaults to the source directory.
+        depth (int): The number of shard directory levels.
+
+    Returns:
+        int: The number of habits files migrated.
+    """
+    data_directory = data_directory or source_directory
+    storage = get_storage()
+    migrated = 0
+
+    with storage.lock(_manifest_paths(data_directory)[2]):
+        manifest = _read_manifest(data_directory)
+        for name in storage.listdir(source_directory):
+            if not name.endswith(HABITS_SUFFIX):
+                continue
+            username = name[:-len(HABITS_SUFFIX)]
+            if username in manifest:
+                continue
+
+            source_file = os.path.join(source_directory, name)
+            habits_file = shard_path(data_directory, username, depth)
+            storage.makedirs(os.path.dirname(habits_file))
+            # The cold archive moves first, so a resumed migration never leaves it behind
+            if storage.exists(cold_file_path(source_file)):
+                storage.replace(cold_file_path(source_file), cold_file_path(habits_file))
+            size = storage.getsize(source_file)
+            storage.replace(source_file, habits_file)
+            manifest[username] = _append_entry(data_directory, username, habits_file, size)
+            migrated += 1
+
+        _write_manifest(data_directory, manifest)
+    print(f"\n\033[1mMigrated {migrated} habit files to the sharded layout.\033[0m\n")
+    return migrated
@@ -0,0 +1,418 @@
+import threading
+from dataclasses import FrozenInstanceError
+from datetime import datetime
+from itertools import count
+from typing import Dict, Hashable, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+from habit import Habit
+from events import EventBus, HabitEvent, default_bus
+
+
+BITS = 5
+WIDTH = 1 << BITS
+MASK = WIDTH - 1
+HASH_MASK = (1 << 64) - 1
+CHUNK = 32  # Check-offs per shared chunk of a CheckoffHistory
+
+_snapshot_ids = count()
+
+
+class _Leaf:
+    """
+    A trie leaf holding the entries whose keys share a full hash.
+    """
+    __slots__ = ('hash', 'items')
+
+    def __init__(self, key_hash: int, items: Tuple[Tuple[Hashable, object], ...]) -> None:
+        self.hash = key_hash
+        self.items = items
+
+
+_EMPTY = (None,) * WIDTH
+
+
+class PersistentMap(Mapping):
+    """
+    An immutable hash map that shares structure between versions.
+
+    Keys are placed in a trie of 32-way tuples by successive 5 bit slices of their hash.
+    `set` and `delete` copy only the O(log32 n) nodes on the path to the key and return a new
+    map, so earlier versions stay valid and unchanged without being copied.
+
+    Methods:
+    -------
+    set(key, value) -> PersistentMap
+        Return a map with the key set to the value.
+    delete(key) -> PersistentMap
+        Return a map without the key.
+    """
+    __slots__ = ('root', 'size')
+
+    def __init__(self, root: Tuple = _EMPTY, size: int = 0) -> None:
+        self.root = root
+        self.size = size
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self) -> Iterator:
+        stack = [self.root]
+        while stack:
+            for child in stack.pop():
+                if isinstance(child, _Leaf):
+                    for key, _ in child.items:
+                        yield key
+                elif child is not None:
+                    stack.append(child)
+
+    def __getitem__(self, key: Hashable) -> object:
+        key_hash = hash(key) & HASH_MASK
+        node, shift = self.root, 0
+        while True:
+            child = node[(key_hash >> shift) & MASK]
+            if child is None:
+                raise KeyError(key)
+            if isinstance(child, _Leaf):
+                for item_key, value in child.items:
+                    if item_key == key:
+                        return value
+                raise KeyError(key)
+            node, shift = child, shift + BITS
+
+    def set(self, key: Hashable, value: object) -> "PersistentMap":
+        """
+        Return a map with the key set to the value.
+
+        Args:
+            key (Hashable): The key to set.
+            value (object): The value to store.
+
+        Returns:
+            PersistentMap: The new map. This map is unchanged.
+        """
+        root, added = _assoc(self.root, 0, hash(key) & HASH_MASK, key, value)
+        return PersistentMap(root, self.size + added)
+
+    def delete(self, key: Hashable) -> "PersistentMap":
+        """
+        Return a map without the key.
+
+        Args:
+            key (Hashable): The key to remove.
+
+        Returns:
+            PersistentMap: The new map, or this map if the key is missing.
+        """
+        if key not in self:
+            return self
+        root = _dissoc(self.root, 0, hash(key) & HASH_MASK, key)
+        return PersistentMap(root or _EMPTY, self.size - 1)
+
+
+def _assoc(node: Tuple, shift: int, key_hash: int, key: Hashable, value: object) -> Tuple[Tuple, bool]:
+    """
+    Return a copy of a trie node with the key set, and whether the key is new.
+    """
+    index = (key_hash >> shift) & MASK
+    child = node[index]
+    added = False
+    if child is None:
+        child, added = _Leaf(key_hash, ((key, value),)), True
+    elif isinstance(child, _Leaf) and child.hash == key_hash:
+        items = tuple(item for item in child.items if item[0] != key)
+        added = len(items) == len(child.items)
+        child = _Leaf(key_hash, items + ((key, value),))
+    elif isinstance(child, _Leaf):
+        # Two hashes share this slice: push the existing leaf one level down
+        branch = list(_EMPTY)
+        branch[(child.hash >> (shift + BITS)) & MASK] = child
+        child, added = _assoc(tuple(branch), shift + BITS, key_hash, key, value)
+    else:
+        child, added = _assoc(child, shift + BITS, key_hash, key, value)
+    return node[:index] + (child,) + node[index + 1:], added
+
+
+def _dissoc(node: Tuple, shift: int, key_hash: int, key: Hashable) -> Optional[Tuple]:
+    """
+    Return a copy of a trie node without the key, or None if the node became empty.
+    """
+    index = (key_hash >> shift) & MASK
+    child = node[index]
+    if isinstance(child, _Leaf):
+        items = tuple(item for item in child.items if item[0] != key)
+        child = _Leaf(key_hash, items) if items else None
+    else:
+        child = _dissoc(child, shift + BITS, key_hash, key)
+    node = node[:index] + (child,) + node[index + 1:]
+    return None if node == _EMPTY else node
+
+
+class CheckoffHistory(Sequence):
+    """
+    An immutable sequence of check-offs that shares its storage between versions.
+
+    The check-offs are kept in full tuples of CHUNK items followed by a shorter tail. `extend`
+    returns a new history that reuses every full chunk of this one, so appending a check-off
+    copies at most CHUNK items and the tuple of chunk references, never the check-offs themselves.
+
+    Methods:
+    -------
+    extend(checkoffs: Iterable[datetime]) -> CheckoffHistory
+        Return a history with the check-offs appended.
+    """
+    __slots__ = ('chunks', 'tail', 'size')
+
+    def __init__(self, chunks: Tuple[Tuple[datetime, ...], ...] = (), tail: Tuple[datetime, ...] = ()) -> None:
+        self.chunks = chunks
+        self.tail = tail
+        self.size = len(chunks) * CHUNK + len(tail)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self[position] for position in range(*index.indices(self.size)))
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError("check-off index out of range")
+        chunk, offset = divmod(index, CHUNK)
+        if chunk < len(self.chunks):
+            return self.chunks[chunk][offset]
+        return self.tail[offset]
+
+    def __iter__(self) -> Iterator[datetime]:
+        for chunk in self.chunks:
+            yield from chunk
+        yield from self.tail
+
+    def __repr__(self) -> str:
+        return f"CheckoffHistory({list(self)!r})"
+
+    def extend(self, checkoffs: Iterable[datetime]) -> "CheckoffHistory":
+        """
+        Return a history with the check-offs appended.
+
+        Args:
+            checkoffs (Iterable[datetime]): The check-offs to append.
+
+        Returns:
+            CheckoffHistory: The new history. This history is unchanged.
+        """
+        items = self.tail + tuple(checkoffs)
+        full = len(items) - len(items) % CHUNK
+        chunks = self.chunks + tuple(items[start:start + CHUNK] for start in range(0, full, CHUNK))
+        return CheckoffHistory(chunks, items[full:])
+
+
+class FrozenHabit(Habit):
+    """
+    A read-only habit held by snapshots.
+
+    Queries such as `is_broken` and `streak_as_of` work as on a live habit, while assigning a
+    field or calling `check_off`, `update_streak` or `mark_changed` raises FrozenInstanceError
+    without changing anything. Only the private query caches stay writable.
+    """
+    def __setattr__(self, name: str, value: object) -> None:
+        if not name.startswith('_') and self.__dict__.get('_frozen'):
+            raise FrozenInstanceError(f"cannot assign to field '{name}' of a snapshot habit")
+        super().__setattr__(name, value)
+
+    def __delattr__(self, name: str) -> None:
+        raise FrozenInstanceError(f"cannot delete field '{name}' of a snapshot habit")
+
+    def _read_only(self, *args, **kwargs) -> None:
+        raise FrozenInstanceError(f"habit '{self.name}' is a read-only snapshot")
+
+    check_off = update_streak = mark_changed = prune_period_keys = _read_only
+
+
+def _extends(history: CheckoffHistory, checkoffs: List[datetime]) -> bool:
+    """
+    Return whether sorted check-offs only appended to a frozen history, checking the new ones alone.
+    """
+    if not history or len(checkoffs) < len(history):
+        return False
+    if checkoffs[0] != history[0] or checkoffs[len(history) - 1] != history[-1]:
+        return False
+    added = checkoffs[len(history) - 1:]
+    return all(earlier <= later for earlier, later in zip(added, added[1:]))
+
+
+def frozen_habit(habit: Habit, previous: Optional[FrozenHabit] = None) -> FrozenHabit:
+    """
+    Return a read-only copy of a habit for snapshots.
+
+    When the habit only gained check-offs since the previous frozen copy, the copy shares the
+    previous history and appends just the new check-offs. Otherwise the history is rebuilt from
+    the sorted check-offs. The version is carried over.
+
+    Args:
+        habit (Habit): The live habit.
+        previous (FrozenHabit, optional): The last frozen copy of the same live habit.
+
+    Returns:
+        FrozenHabit: The frozen copy.
+    """
+    if previous is not None and _extends(previous.checkoffs, habit.checkoffs):
+        history = previous.checkoffs.extend(habit.checkoffs[len(previous.checkoffs):])
+    else:
+        history = CheckoffHistory().extend(sorted(habit.checkoffs))
+
+    frozen = FrozenHabit(habit.name, habit.periodicity, history, habit.streak, habit.created_at, habit.archive)
+    frozen.version = habit.version
+    frozen._frozen = True
+    return frozen
+
+
+class HabitSnapshot(Mapping):
+    """
+    A consistent, immutable view of a user's habits at one point in time.
+
+    Snapshots behave like a read-only dictionary of frozen habits, iterated in name order, and
+    can be passed to the analytics of `habit_tracker`. They never change, so readers need no locks.
+
+    Attributes:
+        version (int): The number of the snapshot, increasing with every publish.
+        uid (Hashable): Distinguishes snapshot sequences in the analytics cache.
+        taken_at (datetime): The date and time the snapshot was published.
+    """
+    def __init__(self, habits: PersistentMap, version: int, uid: Hashable) -> None:
+        self.habits = habits
+        self.version = version
+        self.uid = uid
+        self.taken_at = datetime.now()
+
+    def __getitem__(self, name: str) -> FrozenHabit:
+        return self.habits[name]
+
+    def __iter__(self) -> Iterator[str]:
+        # The trie is ordered by hash, which varies between processes
+        return iter(sorted(self.habits))
+
+    def __len__(self) -> int:
+        return len(self.habits)
+
+
+class SnapshotPublisher:
+    """
+    Publishes copy-on-write snapshots of a user's habits as they change.
+
+    The publisher follows habit change events and marks the habits they name as dirty. Publishing
+    freezes only the dirty habits into a new version of the persistent map, appending only their
+    new check-offs to the histories of the previous snapshot, so it costs O(changed habits) and
+    shares everything else with the previous snapshot. Publishing is serialized by a lock;
+    reading the current snapshot is a plain attribute read.
+
+    Methods:
+    -------
+    snapshot() -> HabitSnapshot
+        Return the latest published snapshot.
+    publish() -> HabitSnapshot
+        Publish the dirty habits as a new snapshot.
+    invalidate(name: str) -> None
+        Mark a habit, or every habit, as changed outside the tracked mutations.
+    close() -> None
+        Stop following habit change events.
+    """
+    def __init__(self, habits: Dict[str, Habit], bus: Optional[EventBus] = None, auto_publish: bool = True,
+                 data_file: Optional[str] = None) -> None:
+        """
+        Publishes the first snapshot and subscribes to habit change events.
+
+        Args:
+            habits (Dict[str, Habit]): The live habits, mutated by the writer.
+            bus (EventBus, optional): The bus the mutations are published on. Defaults to the shared bus.
+            auto_publish (bool): Publish a snapshot after every batch of events. Otherwise
+                snapshots are only published by calling `publish`.
+            data_file (str, optional): The habits file of the user. When set, events about other
+                files are ignored instead of marking habits of the same name as dirty.
+        """
+        self.habits = habits
+        self.bus = bus or default_bus
+        self.data_file = data_file
+        self.auto_publish = auto_publish
+        self.uid = ('snapshot', next(_snapshot_ids))
+        self.lock = threading.Lock()
+        self.dirty = set(habits)
+        self.sources: Dict[str, Habit] = {}
+        self.current = HabitSnapshot(PersistentMap(), 0, self.uid)
+        self.publish()
+        self.subscription = self.bus.subscribe(self.apply)
+
+    def snapshot(self) -> HabitSnapshot:
+        """
+        Return the latest published snapshot, without locking.
+
+        Returns:
+            HabitSnapshot: The snapshot, which stays consistent however long it is held.
+        """
+        return self.current
+
+    def apply(self, events: List[HabitEvent]) -> None:
+        """
+        Mark the habits named by a batch of events as dirty, publishing if enabled.
+
+        Args:
+            events (List[HabitEvent]): The events to apply.
+        """
+        if self.data_file is not None:
+            events = [event for event in events if event.data_file == self.data_file]
+            if not events:
+                return
+        with self.lock:
+            self.dirty.update(event.name for event in events)
+        if self.auto_publish:
+            self.publish()
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        """
+        Mark a habit as changed by an untracked mutation, such as `load_predefined_habits`.
+
+        Args:
+            name (str, optional): The habit to mark. Defaults to every live and published habit.
+        """
+        with self.lock:
+            # Forget the published sources, so the habits are frozen again even at the same version
+            if name is None:
+                self.dirty.update(self.habits)
+                self.dirty.update(self.current)
+                self.sources.clear()
+            else:
+                self.dirty.add(name)
+                self.sources.pop(name, None)
+
+    def publish(self) -> HabitSnapshot:
+        """
+        Publish the dirty habits as a new snapshot.
+
+        Habits that are still the same object at the same version as when they were last
+        published are skipped, and if nothing changed the current snapshot is kept.
+
+        Returns:
+            HabitSnapshot: The latest snapshot.
+        """
+        with self.lock:
+            published = self.current.habits
+            habits = published
+            for name in self.dirty:
+                habit = self.habits.get(name)
+                source = self.sources.get(name)
+                if habit is None:
+                    habits = habits.delete(name)
+                    self.sources.pop(name, None)
+                elif habit is not source or habits[name].version != habit.version:
+                    previous = habits[name] if habit is source else None
+                    habits = habits.set(name, frozen_habit(habit, previous))
+                    self.sources[name] = habit
+            self.dirty.clear()
+
+            if habits is not published:
+                self.current = HabitSnapshot(habits, self.current.version + 1, self.uid)
+            return self.current
+
+    def close(self) -> None:
+        """
+        Stop following habit change events.
+        """
+        self.bus.unsubscribe(self.subscription)
@@ -0,0 +1,224 @@
+import io
+import os
+import uuid
+import threading
+from contextlib import contextmanager
+from typing import BinaryIO, Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks only exclude threads of the same process
+    fcntl = None
+
+
+class FileStorage:
+    """
+    Stores text files on the local file system. This is the default backend.
+
+    Methods:
+    -------
+    read_text(path: str) -> str
+        Read a file.
+    read_lines(path: str, offset: int) -> BinaryIO
+        Open a file for streaming its lines as bytes, starting at a byte offset.
+    write_text(path: str, text: str) -> None
+        Create or overwrite a file.
+    write_atomic(path: str, text: str) -> None
+        Replace a file as a whole, so readers never see it half written.
+    append_text(path: str, text: str) -> int
+        Append to a file durably and return its new size.
+    exists(path: str) -> bool
+        Check if a file exists.
+    remove(path: str) -> None
+        Delete a file.
+    getsize(path: str) -> int
+        Return the size of a file in bytes.
+    makedirs(path: str) -> None
+        Create a directory and its parents.
+    listdir(path: str) -> List[str]
+        List the file names in a directory.
+    replace(source: str, target: str) -> None
+        Move a file, replacing the target if it exists.
+    lock(path: str) -> ContextManager
+        Hold an exclusive lock on a lock file, across threads and processes.
+    """
+    def __init__(self) -> None:
+        self.locks: Dict[str, threading.Lock] = {}
+        self.locks_lock = threading.Lock()
+
+    def read_text(self, path: str) -> str:
+        """Read a file."""
+        with open(path, 'r') as f:
+            return f.read()
+
+    def read_lines(self, path: str, offset: int = 0) -> BinaryIO:
+        """Open a file for streaming its lines as bytes, starting at a byte offset. Close it when done."""
+        f = open(path, 'rb')
+        f.seek(offset)
+        return f
+
+    def write_text(self, path: str, text: str) -> None:
+        """Create or overwrite a file."""
+        with open(path, 'w') as f:
+            f.write(text)
+
+    def write_atomic(self, path: str, text: str) -> None:
+        """Write a file under a unique temporary name and move it into place."""
+        temp_file = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temp_file, 'w') as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_file, path)
+        except BaseException:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+
+    def append_text(self, path: str, text: str) -> int:
+        """Append to a file, sync it to disk and return its new size."""
+        with open(path, 'a') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+            return f.tell()
+
+    def exists(self, path: str) -> bool:
+        """Check if a file exists."""
+        return os.path.exists(path)
+
+    def remove(self, path: str) -> None:
+        """Delete a file."""
+        os.remove(path)
+
+    def getsize(self, path: str) -> int:
+        """Return the size of a file in bytes."""
+        return os.path.getsize(path)
+
+    def makedirs(self, path: str) -> None:
+        """Create a directory and its parents."""
+        os.makedirs(path, exist_ok=True)
+
+    def listdir(self, path: str) -> List[str]:
+        """List the file names in a directory."""
+        with os.scandir(path) as entries:
+            return [entry.name for entry in entries if entry.is_file()]
+
+    def replace(self, source: str, target: str) -> None:
+        """Move a file, replacing the target if it exists."""
+        os.replace(source, target)
+
+    @contextmanager
+    def lock(self, path: str) -> Iterator[None]:
+        """Hold an exclusive lock on a lock file, across threads and processes."""
+        path = os.path.abspath(path)
+        with self.locks_lock:
+            thread_lock = self.locks.setdefault(path, threading.Lock())
+        with thread_lock, open(path, 'a') as f:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class MemoryStorage:
+    """
+    Stores text files in a dictionary, for tests and benchmarks that must not touch the disk.
+
+    Paths are normalized, so the same file can be addressed with equivalent paths. Directories
+    exist implicitly. All methods are thread safe and mirror those of `FileStorage`.
+
+    Attributes:
+        files (Dict[str, str]): File paths mapped to their contents.
+    """
+    def __init__(self, files: Optional[Dict[str, str]] = None) -> None:
+        self.files: Dict[str, str] = {os.path.normpath(path): text for path, text in (files or {}).items()}
+        self.files_lock = threading.Lock()
+        self.locks: Dict[str, threading.Lock] = {}
+
+    def read_text(self, path: str) -> str:
+        with self.files_lock:
+            try:
+                return self.files[os.path.normpath(path)]
+            except KeyError:
+                raise FileNotFoundError(path) from None
+
+    def read_lines(self, path: str, offset: int = 0) -> BinaryIO:
+        return io.BytesIO(self.read_text(path).encode('utf-8')[offset:])
+
+    def write_text(self, path: str, text: str) -> None:
+        with self.files_lock:
+            self.files[os.path.normpath(path)] = text
+
+    def write_atomic(self, path: str, text: str) -> None:
+        self.write_text(path, text)
+
+    def append_text(self, path: str, text: str) -> int:
+        path = os.path.normpath(path)
+        with self.files_lock:
+            self.files[path] = self.files.get(path, '') + text
+            return len(self.files[path].encode('utf-8'))
+
+    def exists(self, path: str) -> bool:
+        return os.path.normpath(path) in self.files
+
+    def remove(self, path: str) -> None:
+        with self.files_lock:
+            if self.files.pop(os.path.normpath(path), None) is None:
+                raise FileNotFoundError(path)
+
+    def getsize(self, path: str) -> int:
+        return len(self.read_text(path).encode('utf-8'))
+
+    def makedirs(self, path: str) -> None:
+        pass
+
+    def listdir(self, path: str) -> List[str]:
+        path = os.path.normpath(path)
+        with self.files_lock:
+            return [os.path.basename(name) for name in self.files if os.path.dirname(name) == path]
+
+    def replace(self, source: str, target: str) -> None:
+        with self.files_lock:
+            if os.path.normpath(source) not in self.files:
+                raise FileNotFoundError(source)
+            self.files[os.path.normpath(target)] = self.files.pop(os.path.normpath(source))
+
+    @contextmanager
+    def lock(self, path: str) -> Iterator[None]:
+        with self.files_lock:
+            thread_lock = self.locks.setdefault(os.path.normpath(path), threading.Lock())
+        with thread_lock:
+            yield
+
+
+_storage = FileStorage()
+
+
+def get_storage():
+    """
+    Return the storage backend used by habit_tracker, UserConn, sharding, tiering and events.
+
+    Returns:
+        FileStorage or MemoryStorage: The active backend.
+    """
+    return _storage
+
+
+def set_storage(storage) -> object:
+    """
+    Point habit_tracker, UserConn, sharding, tiering and events at another storage backend.
+
+    Args:
+        storage (FileStorage or MemoryStorage): The backend to use from now on.
+
+    Returns:
+        FileStorage or MemoryStorage: The previous backend, so it can be restored.
+    """
+    global _storage
+    previous, _storage = _storage, storage
+    return previous
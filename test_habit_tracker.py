@@ -1,8 +1,13 @@
+import sys
 import unittest
+import tempfile
+import threading
+from unittest.mock import patch
+from dataclasses import FrozenInstanceError
 from datetime import datetime, timedelta
 import os
 import json
-from habit import Habit
+from habit import Habit, HabitSet
 from habit_tracker import (
     add_habit,
     delete_habit,
@@ -12,32 +17,76 @@ from habit_tracker import (
     current_weekly_habits,
     struggled_habits_last_month,
     view_all_habits,
+    habit_status_as_of,
+    save_data,
+    load_data,
+    analytics_cache,
+    format_habit,
 )
+from listing import HabitListing, render_page
+from history_codec import decode_history, encode_history
+from tiering import archive_history, cold_file_path, full_history, longest_streak_ever, total_checkoffs
 from user_conn import UserConn
+from events import EventBus, EventLog, HabitAdded, HabitCheckedOff, HabitDeleted, StreakChanged
+from periodicity import is_valid_periodicity, period_key
+from sharding import load_manifest, migrate_flat_layout, shard_path
+from snapshot import PersistentMap, SnapshotPublisher
+from storage import FileStorage, MemoryStorage, get_storage, set_storage
 
+try:
+    import cohort_report
+except ImportError:  # NumPy is only needed for the cohort report
+    cohort_report = None
 
-class BaseTestHabit(unittest.TestCase):
+
+class MemoryStorageTestCase(unittest.TestCase):
+    """
+    Base test class that points all persistence at a fresh in-memory storage backend, so tests
+    never write to disk and can run in parallel processes.
+    """
+
+    def setUp(self):
+        """
+        Install an empty in-memory storage backend.
+        """
+        self.storage = MemoryStorage()
+        self.previous_storage = set_storage(self.storage)
+
+    def tearDown(self):
+        """
+        Restore the previous storage backend.
+        """
+        set_storage(self.previous_storage)
+
+
+class BaseTestHabit(MemoryStorageTestCase):
     """
     Base test class containing shared setup and utility methods for habit testing.
+
+    The 4 weeks of test data are generated once per process and copied into each test's own
+    in-memory storage.
     """
 
+    dataset = None
+
     def setUp(self):
         """
         Set up test cases by loading the 4 weeks of test data from test_habits.json.
         """
+        super().setUp()
         self.data_file = os.path.join(os.path.dirname(__file__), "test_habits.json")
+        if BaseTestHabit.dataset is None:
+            print(f"\n\033[1mtest_habits.json not found. Generating test data...\033[0m")
+            self.generate_4_weeks_of_test_data()
+            BaseTestHabit.dataset = dict(self.storage.files)
+        self.storage.files.update(BaseTestHabit.dataset)
         self.habits = self.load_test_data()
 
     def load_test_data(self):
         """
         Load the 4 weeks of test data from test_habits.json.
         """
-        if not os.path.exists(self.data_file):
-            print(f"\n\033[1mtest_habits.json not found. Generating test data...\033[0m")
-            self.generate_4_weeks_of_test_data()
-
-        with open(self.data_file, "r") as file:
-            habits_data = json.load(file)
+        habits_data = json.loads(get_storage().read_text(self.data_file))
 
         # Convert JSON data back to Habit objects
         habits = {}
@@ -86,19 +135,10 @@ class BaseTestHabit(unittest.TestCase):
                 "streak": habit.streak,
             }
 
-        with open(self.data_file, "w") as file:
-            json.dump(habits_data, file, indent=4)
+        get_storage().write_text(self.data_file, json.dumps(habits_data, indent=4))
 
         print(f"\n\033[1mGenerated 4 weeks of test data in test_habits.json\033[0m\n")
 
-    def tearDown(self):
-        """
-        Clean up test files after each test.
-        """
-        if os.path.exists(self.data_file):
-            os.remove(self.data_file)
-            print(f"\n\033[1mCleaned up test_habits.json\033[0m")
-
 class TestHabit(BaseTestHabit):
     """
     Test suite for the Habit class, focusing on individual habit functionality.
@@ -244,7 +284,809 @@ class TestHabitTracker(BaseTestHabit):
         else:
             self.assertEqual(len(all_habits), 5)  # Exercise, Meditate, Reading, Shopping, Cleaning
             print("test_view_all_habits: PASSED")
-            
+
+    def test_save_data_replaces_file(self):
+        """
+        Test that habits files on disk are replaced as a whole, never overwritten in place.
+        """
+        set_storage(FileStorage())
+        with tempfile.TemporaryDirectory() as directory:
+            data_file = os.path.join(directory, "alice_habits.json")
+            with patch.object(FileStorage, "write_text", side_effect=AssertionError("written in place")):
+                save_data(self.habits, data_file)
+            self.assertEqual(sorted(load_data(data_file)), sorted(self.habits))
+            self.assertEqual(os.listdir(directory), ["alice_habits.json"])
+        print("test_save_data_replaces_file: PASSED")
+
+
+class TestShardedLayout(MemoryStorageTestCase):
+    """
+    Test suite for the sharded data directory layout and its user manifest.
+    """
+
+    def setUp(self):
+        """
+        Use an in-memory data directory for each test.
+        """
+        super().setUp()
+        self.data_directory = os.path.join(os.path.dirname(__file__), "test_data")
+        self.users_file = os.path.join(self.data_directory, "users.json")
+
+    def test_register_user_sharded(self):
+        """
+        Test that registering a user in the sharded layout writes the habits file into its
+        shard and records it in the manifest.
+        """
+        conn = UserConn(users_file=self.users_file, data_directory=self.data_directory, layout="sharded")
+        conn.register_user("alice", "secret")
+        habits_file = shard_path(self.data_directory, "alice")
+        self.assertTrue(self.storage.exists(habits_file))
+        self.assertNotEqual(os.path.dirname(habits_file), self.data_directory)
+        self.assertEqual(conn.list_users(), ["alice"])
+        self.assertTrue(conn.login_user("alice", "secret"))
+        print("test_register_user_sharded: PASSED")
+
+    def test_migrate_flat_layout(self):
+        """
+        Test that habits files registered in the flat layout are moved into shards and can
+        still be logged into afterwards.
+        """
+        flat = UserConn(users_file=self.users_file, data_directory=self.data_directory)
+        for username in ["alice", "bob"]:
+            flat.register_user(username, "secret")
+
+        self.assertEqual(migrate_flat_layout(self.data_directory), 2)
+        self.assertFalse(self.storage.exists(os.path.join(self.data_directory, "alice_habits.json")))
+        self.assertEqual(sorted(load_manifest(self.data_directory)), ["alice", "bob"])
+        self.assertEqual(migrate_flat_layout(self.data_directory), 0)
+
+        sharded = UserConn(users_file=self.users_file, data_directory=self.data_directory, layout="sharded")
+        self.assertTrue(sharded.login_user("bob", "secret"))
+        print("test_migrate_flat_layout: PASSED")
+
+    def test_migrate_moves_cold_archive(self):
+        """
+        Test that a user's cold archive moves into the shard along with the habits file.
+        """
+        flat = UserConn(users_file=self.users_file, data_directory=self.data_directory)
+        flat.register_user("alice", "secret")
+        start = datetime.now() - timedelta(days=99)
+        habits = {"Run": Habit("Run", "daily", checkoffs=[start + timedelta(days=day) for day in range(100)])}
+        archive_history(habits, flat.habits_file("alice"), horizon_days=60)
+
+        migrate_flat_layout(self.data_directory)
+        self.assertNotIn("alice_habits_cold.json", self.storage.listdir(self.data_directory))
+        habits_file = shard_path(self.data_directory, "alice")
+        self.assertEqual(len(full_history(load_data(habits_file)["Run"], habits_file)), 100)
+        print("test_migrate_moves_cold_archive: PASSED")
+
+    def test_concurrent_registrations_keep_manifest(self):
+        """
+        Test that concurrent registrations all reach the manifest journal with current sizes,
+        and that compacting the journal keeps every entry.
+        """
+        conn = UserConn(users_file=self.users_file, data_directory=self.data_directory, layout="sharded")
+        threads = [threading.Thread(target=conn.register_user, args=(f"user{n}", "secret")) for n in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(conn.list_users()), 20)
+
+        conn.login_user("user3", "secret")
+        habits_file = conn.habits_file("user3")
+        add_habit(conn.habits, "Yoga", "daily", habits_file)
+        conn.record_habits_file("user3")
+        self.assertEqual(load_manifest(self.data_directory)["user3"][1], self.storage.getsize(habits_file))
+
+        with patch("sharding.JOURNAL_COMPACT_BYTES", 0):
+            conn.record_habits_file("user4")
+        self.assertEqual(self.storage.read_text(os.path.join(self.data_directory, "manifest.log")), "")
+        self.assertEqual(len(conn.list_users()), 20)
+        print("test_concurrent_registrations_keep_manifest: PASSED")
+
+
+class TestPeriodicity(unittest.TestCase):
+    """
+    Test suite for the period key engine.
+    """
+
+    def test_period_keys(self):
+        """
+        Test that adjacent periods have consecutive keys for every supported periodicity.
+        """
+        monday = datetime(2024, 12, 30, 9)  # ISO week 1 of 2025 starts in 2024
+        sunday = monday + timedelta(days=6, hours=14)
+        self.assertEqual(period_key("daily", monday + timedelta(days=1)), period_key("daily", monday) + 1)
+        self.assertEqual(period_key("weekly", sunday), period_key("weekly", monday))
+        self.assertEqual(period_key("weekly", sunday + timedelta(hours=1)), period_key("weekly", monday) + 1)
+        keys = [period_key("every_3_days", monday + timedelta(days=day)) for day in range(6)]
+        self.assertEqual([keys[day + 3] - keys[day] for day in range(3)], [1, 1, 1])
+        keys = [period_key("weekdays:mon,wed,fri", monday + timedelta(days=day)) for day in range(8)]
+        self.assertEqual([key - keys[0] for key in keys], [0, 0, 1, 1, 2, 2, 2, 3])
+        print("test_period_keys: PASSED")
+
+    def test_validation(self):
+        """
+        Test that only supported periodicities are accepted.
+        """
+        for periodicity in ["daily", "weekly", "every_2_days", "weekdays:sat,sun"]:
+            self.assertTrue(is_valid_periodicity(periodicity))
+        for periodicity in ["monthly", "every_0_days", "weekdays:funday"]:
+            self.assertFalse(is_valid_periodicity(periodicity))
+        print("test_validation: PASSED")
+
+    def test_weekdays_habit_streak(self):
+        """
+        Test that a habit scheduled on chosen weekdays only counts scheduled days towards its streak.
+        """
+        habit = Habit("Gym", "weekdays:mon,wed,fri")
+        monday = datetime(2025, 1, 6, 7)
+        habit.checkoffs = [monday + timedelta(days=day) for day in [0, 2, 4, 7]]
+        habit.update_streak()
+        self.assertEqual(habit.streak, 4)
+        print("test_weekdays_habit_streak: PASSED")
+
+
+class TestHistoryCodec(BaseTestHabit):
+    """
+    Test suite for the compressed check-off history encoding.
+    """
+
+    def test_round_trip(self):
+        """
+        Test that runs, gaps, repeated days and month boundaries survive encoding losslessly.
+        """
+        start = datetime(2023, 12, 30, 6, 15, 1, 250)
+        checkoffs = [start + timedelta(days=day, minutes=day) for day in [0, 1, 2, 3, 9, 40, 41]]
+        checkoffs.append(checkoffs[2] + timedelta(hours=3))
+        self.assertEqual(decode_history(encode_history(checkoffs)), sorted(checkoffs))
+        self.assertEqual(decode_history(encode_history([])), [])
+
+        # Dates outside the shared day table
+        outliers = [datetime(1960, 2, 28, 1), datetime(1960, 2, 29, 2), datetime(2100, 2, 28, 3), datetime(2100, 3, 1, 4)]
+        self.assertEqual(decode_history(encode_history(outliers)), outliers)
+        print("test_round_trip: PASSED")
+
+    def test_decode_without_state_constructor(self):
+        """
+        Test that the field by field fallback decodes exactly like the state constructor.
+        """
+        start = datetime(1965, 12, 30, 23, 59, 59, 999999)
+        checkoffs = [start + timedelta(days=day * 37 % 500, hours=day % 24, microseconds=day * 7919)
+                     for day in range(400)] + [datetime(2100, 1, 1), datetime(9999, 12, 31, 23, 59, 59, 999999)]
+        blob = encode_history(checkoffs)
+        with patch("history_codec.STATE_CONSTRUCTOR", False):
+            fallback = decode_history(blob)
+        self.assertEqual(fallback, sorted(checkoffs))
+        self.assertEqual(fallback, decode_history(blob))
+        print("test_decode_without_state_constructor: PASSED")
+
+    def test_compact_save_and_load(self):
+        """
+        Test that compact files are smaller and load back into the same habits.
+        """
+        save_data(self.habits, self.data_file, compact=True)
+        saved = json.loads(self.storage.read_text(self.data_file))
+        self.assertTrue(all("history" in habit for habit in saved.values()))
+        loaded = load_data(self.data_file)
+        for name, habit in self.habits.items():
+            self.assertEqual(loaded[name].checkoffs, sorted(habit.checkoffs))
+            self.assertEqual(loaded[name].streak, habit.streak)
+        print("test_compact_save_and_load: PASSED")
+
+
+class TestAsOfQueries(BaseTestHabit):
+    """
+    Test suite for point-in-time streak queries.
+    """
+
+    def test_streak_as_of_matches_replay(self):
+        """
+        Test that checkpointed as-of streaks match a full replay of the truncated history.
+        """
+        habit = Habit("Journal", "daily")
+        start = datetime(2024, 1, 1, 21, 0)
+        habit.checkoffs = [start + timedelta(days=day) for day in range(300) if day % 97 != 50]
+        habit.update_streak()
+
+        for day in [0, 49, 50, 51, 52, 130, 199, 250, 299, 320]:
+            when = start + timedelta(days=day, hours=1)
+            replay = Habit("Journal", "daily", checkoffs=[check for check in habit.checkoffs if check <= when])
+            replay.update_streak()
+            expected = 0 if replay.is_broken(when) else self.run_length(replay)
+            self.assertEqual(habit.streak_as_of(when), expected)
+        self.assertEqual(habit.streak_as_of(start - timedelta(days=1)), 0)
+        print("test_streak_as_of_matches_replay: PASSED")
+
+    def test_checkpoints_extend(self):
+        """
+        Test that appended check-offs extend the checkpoints instead of rebuilding them.
+        """
+        habit = Habit("Journal", "daily")
+        start = datetime(2024, 1, 1, 21, 0)
+        habit.checkoffs = [start + timedelta(days=day) for day in range(200)]
+        habit.update_streak()
+        self.assertEqual(habit.streak_as_of(start + timedelta(days=199, hours=1)), 200)
+        checkpoints = habit._streak_checkpoints()
+
+        habit.checkoffs.extend(start + timedelta(days=day) for day in range(200, 300))
+        with patch.object(habit, "_initial_run", side_effect=AssertionError("rebuilt")):
+            self.assertEqual(habit.streak_as_of(start + timedelta(days=299, hours=1)), 300)
+        self.assertEqual(habit._streak_checkpoints()[:len(checkpoints)], checkpoints)
+        self.assertEqual(len(habit._streak_checkpoints()), 5)
+
+        habit.checkoffs = habit.checkoffs[100:]
+        self.assertEqual(habit.streak_as_of(start + timedelta(days=299, hours=1)), 200)
+        print("test_checkpoints_extend: PASSED")
+
+    def test_as_of_archived_history(self):
+        """
+        Test that as-of queries continue from the archive summary and refuse times before its horizon.
+        """
+        habit = self.habits["Exercise"]
+        now = datetime.now()
+        habit.checkoffs = [now - timedelta(days=day, hours=12) for day in range(100, 40, -1)]
+        archive_history(self.habits, self.data_file, horizon_days=45, now=now)
+        self.assertEqual(habit.checkoffs[0], now - timedelta(days=44, hours=12))
+
+        # After the horizon, but before the first check-off left in the recent window
+        when = now - timedelta(days=44, hours=18)
+        self.assertFalse(habit.is_broken(when))
+        self.assertEqual(habit.streak_as_of(when), 56)
+        self.assertEqual(habit.streak_as_of(now - timedelta(days=41)), 60)
+        with self.assertRaises(ValueError):
+            habit.streak_as_of(now - timedelta(days=60))
+        self.assertNotIn("Exercise", habit_status_as_of(self.habits, now - timedelta(days=60)))
+        print("test_as_of_archived_history: PASSED")
+
+    def test_struggled_skips_archived_history(self):
+        """
+        Test that struggled habits before an archive horizon leave the archived habit out, like
+        habit_status_as_of, instead of raising.
+        """
+        now = datetime.now()
+        for habit in self.habits.values():
+            habit.created_at = now - timedelta(days=200)
+        habit = self.habits["Exercise"]
+        habit.checkoffs = [now - timedelta(days=day) for day in range(150, 0, -3)]
+        archive_history(self.habits, self.data_file, horizon_days=60, now=now)
+
+        past = now - timedelta(days=90)
+        self.assertNotIn("Exercise", struggled_habits_last_month(self.habits, now=past))
+        self.assertNotIn("Exercise", habit_status_as_of(self.habits, past))
+        self.assertIn("Exercise", struggled_habits_last_month(self.habits, now=now - timedelta(days=10)))
+        print("test_struggled_skips_archived_history: PASSED")
+
+    def run_length(self, habit):
+        """
+        Return the length of the run ending at the last check-off.
+        """
+        keys = [habit.period_key(check) for check in habit.checkoffs]
+        length = 1
+        while length < len(keys) and keys[-length] - keys[-length - 1] == 1:
+            length += 1
+        return length
+
+    def test_habit_status_as_of(self):
+        """
+        Test that the tracker report reflects a past reference time.
+        """
+        status = habit_status_as_of(self.habits, datetime.now() - timedelta(days=3))
+        self.assertEqual(status, {})  # Test habits were created today
+
+        for habit in self.habits.values():
+            habit.created_at = datetime.now() - timedelta(days=60)
+        status = habit_status_as_of(self.habits, datetime.now() - timedelta(days=40))
+        self.assertEqual(status["Exercise"], (0, True))
+        status = habit_status_as_of(self.habits, datetime.now() - timedelta(days=3))
+        self.assertEqual(status["Exercise"], (25, False))
+        print("test_habit_status_as_of: PASSED")
+
+
+class TestTiering(BaseTestHabit):
+    """
+    Test suite for moving old check-offs into the cold archive.
+    """
+
+    def test_archive_history(self):
+        """
+        Test that old check-offs leave the habits file but stay available through the summary
+        and the cold tier, and that streaks continue across the horizon.
+        """
+        habit = self.habits["Exercise"]
+        start = datetime.now() - timedelta(days=99)
+        habit.checkoffs = [start + timedelta(days=day) for day in range(100)]
+        original = sorted(habit.checkoffs)
+
+        moved = archive_history(self.habits, self.data_file, horizon_days=60)
+        self.assertLessEqual(set(habit._period_keys), set(habit.checkoffs))
+        loaded = load_data(self.data_file)["Exercise"]
+        self.assertEqual(moved, len(original) - len(loaded.checkoffs))
+        self.assertTrue(all(check >= loaded.archive.horizon for check in loaded.checkoffs))
+        self.assertEqual(total_checkoffs(loaded), 100)
+        self.assertEqual(longest_streak_ever(loaded), 100)
+        self.assertEqual(full_history(loaded, self.data_file), original)
+
+        loaded.streak = 0
+        loaded.update_streak()
+        self.assertEqual(loaded.streak, 100)
+        print("test_archive_history: PASSED")
+
+    def test_corrupt_cold_archive(self):
+        """
+        Test that a corrupt cold archive aborts archiving and leaves the habits and both files untouched.
+        """
+        habit = self.habits["Exercise"]
+        start = datetime.now() - timedelta(days=99)
+        habit.checkoffs = [start + timedelta(days=day) for day in range(100)]
+        archive_history(self.habits, self.data_file, horizon_days=60)
+        habit.checkoffs = [start + timedelta(days=day) for day in range(100)]
+        habits_text = self.storage.read_text(self.data_file)
+        cold_file = cold_file_path(self.data_file)
+        truncated = self.storage.read_text(cold_file)[:-5]
+        self.storage.write_text(cold_file, truncated)
+
+        with self.assertRaises(json.JSONDecodeError):
+            archive_history(self.habits, self.data_file, horizon_days=60)
+        self.assertEqual(len(habit.checkoffs), 100)
+        self.assertEqual(self.storage.read_text(cold_file), truncated)
+        self.assertEqual(self.storage.read_text(self.data_file), habits_text)
+        self.assertFalse([name for name in self.storage.files if name.endswith(".tmp")])
+        print("test_corrupt_cold_archive: PASSED")
+
+    def test_deleted_habit_drops_cold_history(self):
+        """
+        Test that a habit re-added after deletion does not inherit the archived check-offs.
+        """
+        habit = self.habits["Exercise"]
+        start = datetime.now() - timedelta(days=99)
+        habit.checkoffs = [start + timedelta(days=day) for day in range(100)]
+        archive_history(self.habits, self.data_file, horizon_days=60)
+
+        self.habits = delete_habit(self.habits, "Exercise", self.data_file)
+        self.habits = add_habit(self.habits, "Exercise", "daily", self.data_file)
+        self.habits["Exercise"].checkoffs = [start]
+        archive_history(self.habits, self.data_file, horizon_days=60)
+        self.assertEqual(full_history(self.habits["Exercise"], self.data_file), [start])
+        self.assertEqual(self.habits["Exercise"].archive.count, 1)
+        print("test_deleted_habit_drops_cold_history: PASSED")
+
+
+class TestAnalyticsCache(BaseTestHabit):
+    """
+    Test suite for the version-stamped memoization of analytics.
+    """
+
+    def setUp(self):
+        """
+        Wrap the test habits in a versioned habit set and start from an empty cache.
+        """
+        super().setUp()
+        self.habits = HabitSet(self.habits)
+        analytics_cache.clear()
+
+    def test_results_cached_until_mutation(self):
+        """
+        Test that repeated analytics hit the cache and that mutations invalidate it.
+        """
+        self.assertEqual(current_daily_habits(self.habits), ["Exercise", "Meditate", "Reading"])
+        self.assertEqual(current_daily_habits(self.habits), ["Exercise", "Meditate", "Reading"])
+        self.assertEqual(analytics_cache.stats()["hits"], 1)
+
+        self.habits = add_habit(self.habits, "Yoga", "daily", self.data_file)
+        self.assertIn("Yoga", current_daily_habits(self.habits))
+        self.habits = delete_habit(self.habits, "Yoga", self.data_file)
+        self.assertNotIn("Yoga", current_daily_habits(self.habits))
+
+        longest = longest_streak(self.habits)
+        self.habits["Shopping"].streak = 100
+        self.habits["Shopping"].update_streak()
+        self.assertNotEqual(longest_streak(self.habits), longest)
+        self.assertEqual(longest_streak(self.habits), [self.habits["Shopping"]])
+
+        stats = analytics_cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 5))
+        self.assertAlmostEqual(stats["hit_rate"], 2 / 7)
+
+        # Habits report their changes to the set, so the key never visits them
+        self.habits = add_habit(self.habits, "Archery", "daily", self.data_file)
+        version = self.habits.version
+        self.habits = check_off_habit(self.habits, "Archery", self.data_file)
+        self.assertGreater(self.habits.version, version)
+        with patch.object(HabitSet, "values", side_effect=AssertionError("key visited the habits")):
+            analytics_cache.key("longest_streak", self.habits)
+        print("test_results_cached_until_mutation: PASSED")
+
+    def test_struggled_expires_with_window(self):
+        """
+        Test that a struggled habit result expires when its last check-off leaves the 30 day window.
+        """
+        habit = self.habits["Meditate"]
+        habit.checkoffs = [datetime.now() - timedelta(days=29, hours=23, minutes=59, seconds=59)]
+        habit.update_streak()
+
+        self.assertIn("Meditate", struggled_habits_last_month(self.habits))
+        entry = next(iter(analytics_cache.entries.values()))
+        self.assertLessEqual(entry[1], habit.checkoffs[0] + timedelta(days=30))
+
+        # A plain dictionary carries no version and is never cached
+        struggled_habits_last_month(dict(self.habits))
+        stats = analytics_cache.stats()
+        self.assertEqual((stats["size"], stats["misses"], stats["bypassed"]), (1, 1, 1))
+        print("test_struggled_expires_with_window: PASSED")
+
+
+@unittest.skipUnless(cohort_report, "NumPy is not installed")
+class TestCohortReport(MemoryStorageTestCase):
+    """
+    Test suite for the weekday and hour histograms across users.
+    """
+
+    def test_histograms_match_datetimes(self):
+        """
+        Test that plain, compact and archived check-offs of several users are counted in the
+        cell of their weekday and hour, and that partial results merge to the same counts.
+        """
+        start = datetime(2024, 1, 1, 6, 30)
+        checkoffs = {
+            "alice": [start + timedelta(days=day, hours=day % 17) for day in range(90)],
+            "bob": [start + timedelta(days=day * 3, hours=day % 5) for day in range(40)],
+        }
+        for username, checks in checkoffs.items():
+            data_file = os.path.join("data", f"{username}_habits.json")
+            habits = {"Run": Habit("Run", "daily", checkoffs=list(checks))}
+            save_data(habits, data_file, compact=username == "bob")
+        archive_history(load_data(os.path.join("data", "alice_habits.json")),
+                        os.path.join("data", "alice_habits.json"), horizon_days=31, now=start + timedelta(days=60))
+
+        expected = [[0] * 24 for _ in range(7)]
+        for check in checkoffs["alice"] + checkoffs["bob"]:
+            expected[check.weekday()][check.hour] += 1
+
+        histogram = cohort_report.build_cohort_report("data")
+        self.assertEqual(histogram.users, 2)
+        self.assertEqual(histogram.counts[("daily", "Run")].tolist(), expected)
+
+        files = cohort_report.habit_files("data")
+        merged = cohort_report.aggregate_files(files[:1]).merge(cohort_report.aggregate_files(files[1:]))
+        self.assertEqual(merged.total().tolist(), expected)
+
+        # A corrupt cold archive is skipped like a corrupt habits file, keeping the recent check-offs
+        cold_file = os.path.join("data", "alice_habits_cold.json")
+        self.storage.write_text(cold_file, self.storage.read_text(cold_file)[:-3])
+        self.storage.write_text(os.path.join("data", "carol_habits.json"), '{"Run": {')
+        histogram = cohort_report.build_cohort_report("data")
+        self.assertEqual(histogram.users, 2)
+        recent = len(load_data(os.path.join("data", "alice_habits.json"))["Run"].checkoffs)
+        self.assertEqual(histogram.total().sum(), len(checkoffs["bob"]) + recent)
+        print("test_histograms_match_datetimes: PASSED")
+
+
+class TestHabitListing(BaseTestHabit):
+    """
+    Test suite for the sorted, paginated habit listing.
+    """
+
+    def setUp(self):
+        """
+        Build a listing over the test habits that follows a private event bus.
+        """
+        super().setUp()
+        self.bus = EventBus()
+        self.listing = HabitListing(self.habits, self.bus)
+
+    def test_pages_follow_order(self):
+        """
+        Test that paging with cursors visits every habit once, in order.
+        """
+        names, cursor = [], None
+        while True:
+            page, cursor = self.listing.page("name", limit=2, cursor=cursor)
+            names.extend(habit.name for habit in page)
+            if cursor is None:
+                break
+        self.assertEqual(names, sorted(self.habits))
+
+        page, _ = self.listing.page("streak", limit=3, descending=True)
+        self.assertEqual([habit.streak for habit in page], sorted((h.streak for h in self.habits.values()), reverse=True)[:3])
+        print("test_pages_follow_order: PASSED")
+
+    def test_orderings_follow_mutations(self):
+        """
+        Test that added, checked off and deleted habits are re-positioned without a rebuild.
+        """
+        page, cursor = self.listing.page("name", limit=2)
+        self.habits = add_habit(self.habits, "Archery", "daily", self.data_file, bus=self.bus)
+        self.habits = add_habit(self.habits, "Yoga", "daily", self.data_file, bus=self.bus)
+        self.habits = delete_habit(self.habits, "Meditate", self.data_file, bus=self.bus)
+        rest, _ = self.listing.page("name", limit=10, cursor=cursor)
+        self.assertEqual([habit.name for habit in rest], ["Reading", "Shopping", "Yoga"])
+
+        self.habits = check_off_habit(self.habits, "Yoga", self.data_file, bus=self.bus)
+        latest, _ = self.listing.page("last_checked", limit=1, descending=True)
+        self.assertEqual(latest[0].name, "Yoga")
+        self.assertEqual(self.listing.orderings, HabitListing(self.habits, EventBus()).orderings)
+        print("test_orderings_follow_mutations: PASSED")
+
+    def test_last_checked_includes_archive(self):
+        """
+        Test that a habit whose check-offs were all archived is ordered and shown by its latest
+        archived check-off, also after saving and loading.
+        """
+        habit = self.habits["Cleaning"]
+        habit.checkoffs = [datetime.now() - timedelta(days=day) for day in range(120, 90, -1)]
+        archive_history(self.habits, self.data_file, horizon_days=60)
+        self.assertEqual(habit.checkoffs, [])
+        habit = load_data(self.data_file)["Cleaning"]
+        last = datetime.now() - timedelta(days=91)
+        self.assertAlmostEqual(habit.last_checkoff(), last, delta=timedelta(seconds=5))
+        self.assertNotIn("Never", format_habit(habit))
+
+        self.habits = add_habit(self.habits, "Yoga", "daily", self.data_file, bus=self.bus)
+        self.listing.rebuild()
+        page, _ = self.listing.page("last_checked", limit=2)
+        self.assertEqual([habit.name for habit in page], ["Yoga", "Cleaning"])
+        print("test_last_checked_includes_archive: PASSED")
+
+    def test_render_page(self):
+        """
+        Test that a page renders into one string with one line per habit.
+        """
+        page, cursor = self.listing.page("name", limit=3)
+        text = render_page(page, 1, more=cursor is not None)
+        self.assertEqual(text.count(" - "), 3)
+        self.assertIn("next page", text)
+        print("test_render_page: PASSED")
+
+    def test_connections_ignore_other_users(self):
+        """
+        Test that a logged in user's listing and snapshots ignore another user's events on the shared bus.
+        """
+        conns = {}
+        for username in ["alice", "bob"]:
+            conn = UserConn(users_file="users.json", data_directory="data")
+            conn.register_user(username, "secret")
+            conn.login_user(username, "secret")
+            conn.habits = add_habit(conn.habits, "Yoga", "daily", conn.habits_file(username))
+            conns[username] = conn
+        alice, bob = conns["alice"], conns["bob"]
+
+        with patch.object(alice.listing, "refresh") as refresh, patch.object(alice.snapshots, "publish") as publish:
+            bob.habits = check_off_habit(bob.habits, "Yoga", bob.habits_file("bob"))
+        refresh.assert_not_called()
+        publish.assert_not_called()
+        self.assertEqual(len(alice.snapshot()["Yoga"].checkoffs), 0)
+        self.assertEqual(len(bob.snapshot()["Yoga"].checkoffs), 1)
+        alice.logout()
+        bob.logout()
+        print("test_connections_ignore_other_users: PASSED")
+
+
+class TestSnapshots(BaseTestHabit):
+    """
+    Test suite for copy-on-write snapshots of the habit set.
+    """
+
+    def setUp(self):
+        """
+        Publish snapshots of the test habits from a private event bus.
+        """
+        super().setUp()
+        self.bus = EventBus()
+        self.publisher = SnapshotPublisher(self.habits, self.bus)
+
+    def test_persistent_map_shares_versions(self):
+        """
+        Test that setting and deleting keys leaves earlier versions of the map unchanged.
+        """
+        versions, expected = [PersistentMap()], [{}]
+        for number in range(200):
+            versions.append(versions[-1].set(f"key{number % 150}", number))
+            expected.append({**expected[-1], f"key{number % 150}": number})
+        versions.append(versions[-1].delete("key7").delete("missing"))
+        expected.append({key: value for key, value in expected[-1].items() if key != "key7"})
+        self.assertEqual([dict(version) for version in versions], expected)
+        self.assertEqual(len(versions[-1]), 149)
+        print("test_persistent_map_shares_versions: PASSED")
+
+    def test_snapshots_isolate_readers(self):
+        """
+        Test that a held snapshot stays consistent while check-offs and deletions publish new
+        snapshots that share the unchanged habits.
+        """
+        before = self.publisher.snapshot()
+        checkoffs = len(before["Exercise"].checkoffs)
+
+        self.habits = add_habit(self.habits, "Yoga", "daily", self.data_file, bus=self.bus)
+        self.habits = check_off_habit(self.habits, "Yoga", self.data_file, bus=self.bus)
+        self.habits["Exercise"].checkoffs.append(datetime.now())
+        self.habits = delete_habit(self.habits, "Meditate", self.data_file, bus=self.bus)
+        after = self.publisher.snapshot()
+
+        self.assertEqual(sorted(before), ["Cleaning", "Exercise", "Meditate", "Reading", "Shopping"])
+        self.assertEqual(len(before["Exercise"].checkoffs), checkoffs)
+        self.assertEqual(sorted(after), ["Cleaning", "Exercise", "Reading", "Shopping", "Yoga"])
+        self.assertEqual(len(after["Yoga"].checkoffs), 1)
+        self.assertIs(after["Reading"], before["Reading"])
+        self.assertGreater(after.version, before.version)
+        self.assertEqual(current_daily_habits(after), ["Exercise", "Reading", "Yoga"])
+
+        # Untracked mutations are only published after an invalidation
+        self.publisher.invalidate("Exercise")
+        self.assertEqual(len(self.publisher.publish()["Exercise"].checkoffs), checkoffs + 1)
+        with self.assertRaises(AttributeError):
+            after["Yoga"].checkoffs.append(datetime.now())
+        print("test_snapshots_isolate_readers: PASSED")
+
+    def test_frozen_habits_share_history(self):
+        """
+        Test that publishing after a check-off shares the earlier history chunks, and that frozen
+        habits reject every mutation without changing.
+        """
+        habit = self.habits["Exercise"]
+        habit.checkoffs = [datetime.now() - timedelta(days=day) for day in range(100, 0, -1)]
+        self.publisher.invalidate("Exercise")
+        before = self.publisher.publish()["Exercise"]
+
+        self.habits = check_off_habit(self.habits, "Exercise", self.data_file, bus=self.bus)
+        after = self.publisher.snapshot()["Exercise"]
+        self.assertEqual(list(after.checkoffs), habit.checkoffs)
+        self.assertEqual(len(before.checkoffs), 100)
+        self.assertIs(after.checkoffs.chunks[0], before.checkoffs.chunks[0])
+        self.assertEqual(after.checkoffs[-2:], tuple(habit.checkoffs[-2:]))
+        self.assertEqual(after.streak_as_of(datetime.now()), habit.streak_as_of(datetime.now()))
+
+        version, streak = after.version, after.streak
+        for mutate in [after.update_streak, after.check_off, lambda: setattr(after, "streak", 0),
+                       lambda: setattr(after, "archive", None)]:
+            with self.assertRaises(FrozenInstanceError):
+                mutate()
+        self.assertEqual((after.version, after.streak), (version, streak))
+        print("test_frozen_habits_share_history: PASSED")
+
+    def test_concurrent_readers(self):
+        """
+        Test that threads querying the same frozen habit at once all get the streaks of a
+        sequential replay, while the habit's lazy caches are being built.
+        """
+        habit = self.habits["Exercise"]
+        start = datetime.now() - timedelta(days=4400)
+        habit.checkoffs = [start + timedelta(days=day) for day in range(4400) if day % 211 != 7]
+        habit.update_streak()
+        times = [start + timedelta(days=day, hours=1) for day in range(0, 4400, 37)]
+        expected = [habit.streak_as_of(when) for when in times]
+
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            for _ in range(5):
+                self.publisher.invalidate("Exercise")
+                frozen = self.publisher.publish()["Exercise"]
+                barrier = threading.Barrier(8)
+                results, errors = [], []
+
+                def read():
+                    barrier.wait()
+                    try:
+                        results.append([frozen.streak_as_of(when) for when in times])
+                    except Exception as error:
+                        errors.append(error)
+
+                threads = [threading.Thread(target=read) for _ in range(8)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                self.assertEqual(errors, [])
+                self.assertEqual(results, [expected] * 8)
+        finally:
+            sys.setswitchinterval(switch_interval)
+        print("test_concurrent_readers: PASSED")
+
+
+class TestEvents(BaseTestHabit):
+    """
+    Test suite for the habit change events, their batched delivery and the durable feed.
+    """
+
+    def test_mutations_emit_events(self):
+        """
+        Test that adding, checking off and deleting a habit emit typed events in order.
+        """
+        bus = EventBus()
+        received = []
+        bus.subscribe(received.extend)
+        self.habits = add_habit(self.habits, "Yoga", "daily", self.data_file, bus=bus)
+        self.habits = check_off_habit(self.habits, "Yoga", self.data_file, bus=bus)
+        self.habits = delete_habit(self.habits, "Yoga", self.data_file, bus=bus)
+        types = [type(event).__name__ for event in received]
+        self.assertEqual(types, ["HabitAdded", "HabitCheckedOff", "StreakChanged", "HabitDeleted"])
+        self.assertEqual({event.data_file for event in received}, {self.data_file})
+        print("test_mutations_emit_events: PASSED")
+
+    def test_batched_bounded_delivery(self):
+        """
+        Test that callbacks receive full batches and that polling queues drop the oldest events.
+        """
+        bus = EventBus()
+        batches = []
+        bus.subscribe(batches.append, batch_size=2, max_queue=4)
+        polled = bus.subscribe(max_queue=2)
+        for name in ["a", "b", "c"]:
+            bus.publish(HabitCheckedOff(name))
+        self.assertEqual([len(batch) for batch in batches], [2])
+        bus.flush()
+        self.assertEqual([len(batch) for batch in batches], [2, 1])
+        self.assertEqual([event.name for event in polled.poll()], ["b", "c"])
+        self.assertEqual(polled.dropped, 1)
+        print("test_batched_bounded_delivery: PASSED")
+
+    def test_failing_subscriber_is_isolated(self):
+        """
+        Test that a raising subscriber neither breaks the check-off nor starves other subscribers,
+        and that its events stay queued until it recovers.
+        """
+        bus = EventBus()
+        failing = {"enabled": True}
+        delivered = []
+
+        def flaky(events):
+            if failing["enabled"]:
+                raise OSError("feed unavailable")
+            delivered.extend(events)
+
+        broken = bus.subscribe(flaky, max_queue=8)
+        received = []
+        bus.subscribe(received.extend)
+        self.habits = add_habit(self.habits, "Yoga", "daily", self.data_file, bus=bus)
+        self.habits = check_off_habit(self.habits, "Yoga", self.data_file, bus=bus)
+
+        self.assertEqual(len(load_data(self.data_file)["Yoga"].checkoffs), 1)
+        self.assertEqual([type(event) for event in received], [HabitAdded, HabitCheckedOff, StreakChanged])
+        self.assertEqual((broken.failures, len(broken.pending)), (3, 3))
+        self.assertIsInstance(broken.last_error, OSError)
+
+        failing["enabled"] = False
+        bus.flush()
+        self.assertEqual(delivered, received)
+        print("test_failing_subscriber_is_isolated: PASSED")
+
+    def test_event_log_offsets(self):
+        """
+        Test that the durable feed can be consumed incrementally from stored offsets.
+        """
+        feed_file = os.path.join(os.path.dirname(__file__), "feed.jsonl")
+        log = EventLog(feed_file)
+        log.append([HabitAdded("Yoga", periodicity="daily"), HabitCheckedOff("Yoga", data_file="bob_habits.json")])
+        events, offset = log.read(0, limit=1)
+        self.assertIsInstance(events[0], HabitAdded)
+        log.append([HabitDeleted("Yoga")])
+        events, offset = log.read(offset)
+        self.assertEqual([type(event) for event in events], [HabitCheckedOff, HabitDeleted])
+        self.assertEqual(events[0].data_file, "bob_habits.json")
+        self.assertEqual(log.read(offset), ([], offset))
+        print("test_event_log_offsets: PASSED")
+
+    def test_event_log_on_disk(self):
+        """
+        Test that the feed on disk is streamed from byte offsets and stops before a partial line.
+        """
+        set_storage(FileStorage())
+        with tempfile.TemporaryDirectory() as directory:
+            feed_file = os.path.join(directory, "feed.jsonl")
+            log = EventLog(feed_file)
+            self.assertEqual(log.read(0), ([], 0))
+            end = log.append([HabitAdded("Yoga ☀", periodicity="daily"), HabitCheckedOff("Yoga ☀")])
+            events, offset = log.read(0, limit=1)
+            self.assertEqual(events[0].name, "Yoga ☀")
+            with open(feed_file, 'a') as f:
+                f.write('{"type":"HabitDeleted"')
+            events, offset = log.read(offset)
+            self.assertEqual([type(event) for event in events], [HabitCheckedOff])
+            self.assertEqual(offset, end)
+        print("test_event_log_on_disk: PASSED")
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
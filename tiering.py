@@ -0,0 +1,176 @@
+import json
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from habit import Habit, HistorySummary
+from habit_tracker import save_data, cold_file_path, load_cold_archive
+from storage import get_storage
+from history_codec import encode_history, decode_history
+
+
+def _period_runs(habit: Habit, checkoffs: List[datetime], runs: List[List[int]]) -> List[List[int]]:
+    """
+    Extend a list of [first key, last key] runs of consecutive periods with sorted check-offs.
+    """
+    for check in checkoffs:
+        key = habit.period_key(check)
+        if runs and key - runs[-1][1] in (0, 1):
+            runs[-1][1] = key
+        else:
+            runs.append([key, key])
+    return runs
+
+
+def summarize_history(habit: Habit, checkoffs: List[datetime], horizon: datetime) -> HistorySummary:
+    """
+    Roll archived check-offs up into monthly counts, runs of consecutive periods and the longest streak.
+
+    Args:
+        habit (Habit): The habit the check-offs belong to.
+        checkoffs (List[datetime]): The archived check-offs in ascending order.
+        horizon (datetime): The date and time before which check-offs are archived.
+
+    Returns:
+        HistorySummary: The summary of the archived check-offs.
+    """
+    monthly = Counter(check.strftime('%Y-%m') for check in checkoffs)
+    runs = _period_runs(habit, checkoffs, [])
+
+    return HistorySummary(
+        horizon=horizon,
+        count=len(checkoffs),
+        monthly=dict(sorted(monthly.items())),
+        runs=[(first, last) for first, last in runs],
+        longest_streak=max((last - first + 1 for first, last in runs), default=0),
+        last_checkoff=checkoffs[-1] if checkoffs else None,
+    )
+
+
+def archive_history(habits: Dict[str, Habit], data_file: str, horizon_days: int = 90,
+                    now: Optional[datetime] = None) -> int:
+    """
+    Move check-offs older than the horizon from the habits file into its cold archive.
+
+    The archived check-offs are summarized on each habit, so the longest streak, aggregate counts
+    and streaks continuing into the recent window stay available without loading the cold tier.
+    The cold archive is moved into place before the habits file is written, so an interruption
+    never loses check-offs, and a corrupt cold archive aborts archiving before anything changes.
+
+    Args:
+        habits (Dict[str, Habit]): The current dictionary of habits.
+        data_file (str): The file path for saving the data.
+        horizon_days (int): The number of recent days kept in the habits file. At least 31, so
+            the analytics over the last month only need the recent window.
+        now (datetime, optional): The reference time. Defaults to the current time.
+
+    Returns:
+        int: The number of check-offs moved to the cold archive.
+
+    Raises:
+        json.JSONDecodeError: If the existing cold archive is corrupt.
+    """
+    if horizon_days < 31:
+        raise ValueError("horizon_days must be at least 31.")
+
+    horizon = (now or datetime.now()) - timedelta(days=horizon_days)
+    archive = {name: blob for name, blob in load_cold_archive(data_file).items() if name in habits}
+    archived: Dict[str, List[datetime]] = {}
+    moved = 0
+
+    for name, habit in habits.items():
+        cold = [check for check in habit.checkoffs if check < horizon]
+        if not cold:
+            continue
+        moved += len(cold)
+        if name in archive:
+            cold = sorted(set(decode_history(archive[name])).union(cold))
+        else:
+            cold.sort()
+        archive[name] = encode_history(cold)
+        archived[name] = cold
+
+    get_storage().write_atomic(cold_file_path(data_file), json.dumps(archive, separators=(",", ":")))
+
+    for name, cold in archived.items():
+        habit = habits[name]
+        habit.archive = summarize_history(habit, cold, horizon)
+        habit.checkoffs = [check for check in habit.checkoffs if check >= horizon]
+        habit.prune_period_keys()
+        habit.mark_changed()
+
+    save_data(habits, data_file)
+    return moved
+
+
+def load_cold_history(habit: Habit, data_file: str) -> List[datetime]:
+    """
+    Fetch the archived check-offs of a habit from the cold tier.
+
+    Args:
+        habit (Habit): The habit whose archive is loaded.
+        data_file (str): The path of the habits file.
+
+    Returns:
+        List[datetime]: The archived check-offs in ascending order.
+    """
+    if not habit.archive:
+        return []
+    blob = load_cold_archive(data_file).get(habit.name)
+    return decode_history(blob) if blob else []
+
+
+def full_history(habit: Habit, data_file: str) -> List[datetime]:
+    """
+    Return the complete check-off history of a habit, including the cold tier.
+
+    Args:
+        habit (Habit): The habit whose history is returned.
+        data_file (str): The path of the habits file.
+
+    Returns:
+        List[datetime]: Archived and recent check-offs in ascending order.
+    """
+    return load_cold_history(habit, data_file) + sorted(habit.checkoffs)
+
+
+def total_checkoffs(habit: Habit) -> int:
+    """
+    Count all check-offs of a habit from its summary and recent window, without loading the cold tier.
+
+    Args:
+        habit (Habit): The habit to count.
+
+    Returns:
+        int: The number of check-offs ever recorded.
+    """
+    return (habit.archive.count if habit.archive else 0) + len(habit.checkoffs)
+
+
+def monthly_counts(habit: Habit) -> Dict[str, int]:
+    """
+    Count the check-offs of a habit per month, without loading the cold tier.
+
+    Args:
+        habit (Habit): The habit to count.
+
+    Returns:
+        Dict[str, int]: Check-offs per 'YYYY-MM' month, in chronological order.
+    """
+    counts = Counter(habit.archive.monthly if habit.archive else {})
+    counts.update(check.strftime('%Y-%m') for check in habit.checkoffs)
+    return dict(sorted(counts.items()))
+
+
+def longest_streak_ever(habit: Habit) -> int:
+    """
+    Return the longest run of consecutive periods over the full history, without loading the cold tier.
+
+    Args:
+        habit (Habit): The habit to analyze.
+
+    Returns:
+        int: The longest streak, counting runs that continue from the archive into the recent window.
+    """
+    runs = [list(run) for run in habit.archive.runs] if habit.archive else []
+    runs = _period_runs(habit, sorted(habit.checkoffs), runs)
+    return max((last - first + 1 for first, last in runs), default=0)
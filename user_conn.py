@@ -1,7 +1,13 @@
 import os
 import json
-from typing import Dict, Optional
+from typing import List, Optional
+from habit import HabitSet
 from habit_tracker import load_data, save_data, load_predefined_habits, view_all_habits
+from sharding import shard_path, record_user, list_users
+from tiering import archive_history
+from storage import get_storage
+from listing import HabitListing
+from snapshot import HabitSnapshot, SnapshotPublisher
 
 
 class UserConn:
@@ -24,8 +30,15 @@ class UserConn:
         Logs out the current user.
     load_predefined_habits() -> None
         Load predefined habits for the current user.
+    habits_file(username: str) -> str
+        Return the path of a user's habits file for the configured layout.
+    list_users() -> List[str]
+        List registered users from the manifest of a sharded data directory.
+    snapshot() -> Optional[HabitSnapshot]
+        Return an immutable snapshot of the current user's habits for long-running readers.
     """
-    def __init__(self, users_file: str = None, data_directory: str = None) -> None:
+    def __init__(self, users_file: str = None, data_directory: str = None, layout: str = "flat",
+                 history_horizon_days: Optional[int] = None) -> None:
         """
         Initializes the UserConn object and loads existing users from the specified file.
 
@@ -35,12 +48,23 @@ class UserConn:
             The file path where user data is stored.
         data_directory : str, optional
             The directory where habit files will be stored.
+        layout : str, optional
+            'flat' stores every habits file directly in the data directory, 'sharded'
+            spreads them over hashed subdirectories indexed by a manifest.
+        history_horizon_days : int, optional
+            When set, check-offs older than this many days are moved to the cold archive on logout.
         """
+        if layout not in ('flat', 'sharded'):
+            raise ValueError("Invalid layout. Please use 'flat' or 'sharded'.")
         self.current_directory = os.path.dirname(os.path.abspath(__file__))
         self.users_file = users_file or os.path.join(self.current_directory, "users.json")
         self.data_directory = data_directory or self.current_directory
+        self.layout = layout
+        self.history_horizon_days = history_horizon_days
         self.current_user: Optional[str] = None
-        self.habits: Dict[str, Dict] = {}
+        self.habits: HabitSet = HabitSet()
+        self.listing: Optional[HabitListing] = None
+        self.snapshots: Optional[SnapshotPublisher] = None
         self.load_users()
 
     def register_user(self, username: str, password: str) -> None:
@@ -68,9 +92,11 @@ class UserConn:
 
         self.save_user_credentials(username, password)
 
-        habits_file = os.path.join(self.data_directory, f"{username}_habits.json")
-        with open(habits_file, 'w') as f:
-            json.dump({}, f)
+        habits_file = self.habits_file(username)
+        if self.layout == 'sharded':
+            get_storage().makedirs(os.path.dirname(habits_file))
+        get_storage().write_text(habits_file, json.dumps({}))
+        self.record_habits_file(username)
 
         print(f"User \033[1m'{username}'\033[0m registered successfully.\033[0m")
 
@@ -95,17 +121,21 @@ class UserConn:
             print("\n\033[1mUser does not exist. Please register first.\033[0m\n")
             return False
 
-        with open(self.users_file, 'r') as f:
-            users = json.load(f)
-            if users.get(username) == password:
-                self.current_user = username
-                habits_file = os.path.join(self.data_directory, f"{username}_habits.json")
-                self.habits = load_data(habits_file)
-                print(f"Welcome, \033[1m{username}!\033[0m")
-                return True
-            else:
-                print("\033[1mIncorrect password.\033[0m")
-                return False
+        users = json.loads(get_storage().read_text(self.users_file))
+        if users.get(username) == password:
+            self.current_user = username
+            self.habits = load_data(self.habits_file(username))
+            if self.listing:
+                self.listing.close()
+                self.snapshots.close()
+            # Follow only this user's events, which other connections publish on the same bus
+            self.listing = HabitListing(self.habits, data_file=self.habits_file(username))
+            self.snapshots = SnapshotPublisher(self.habits, data_file=self.habits_file(username))
+            print(f"Welcome, \033[1m{username}!\033[0m")
+            return True
+        else:
+            print("\033[1mIncorrect password.\033[0m")
+            return False
 
     def user_exists(self, username: str) -> bool:
         """
@@ -118,9 +148,8 @@ class UserConn:
             bool: True if the user exists, False otherwise.
         """
         try:
-            with open(self.users_file, 'r') as f:
-                users = json.load(f)
-                return username in users
+            users = json.loads(get_storage().read_text(self.users_file))
+            return username in users
         except FileNotFoundError:
             return False
 
@@ -132,16 +161,67 @@ class UserConn:
             username (str): The username to save.
             password (str): The password to save.
         """
-        try:
-            with open(self.users_file, 'r') as f:
-                users = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            users = {}
+        # Lock the read-modify-write, so concurrent registrations do not lose each other
+        storage = get_storage()
+        with storage.lock(f"{self.users_file}.lock"):
+            try:
+                users = json.loads(storage.read_text(self.users_file))
+            except (FileNotFoundError, json.JSONDecodeError):
+                users = {}
+
+            users[username] = password
+
+            storage.write_atomic(self.users_file, json.dumps(users, indent=2))
+
+    def habits_file(self, username: str) -> str:
+        """
+        Return the path of a user's habits file for the configured layout.
+
+        Args:
+            username (str): The user whose habits file is located.
+
+        Returns:
+            str: The path of the user's habits file.
+        """
+        if self.layout == 'sharded':
+            return shard_path(self.data_directory, username)
+        return os.path.join(self.data_directory, f"{username}_habits.json")
+
+    def record_habits_file(self, username: str) -> None:
+        """
+        Refresh the user's manifest entry when the data directory is sharded.
+
+        Args:
+            username (str): The user whose habits file was written.
+        """
+        if self.layout == 'sharded':
+            record_user(self.data_directory, username)
+
+    def list_users(self) -> List[str]:
+        """
+        List registered users from the manifest of a sharded data directory.
+
+        Returns:
+            List[str]: The usernames with a habits file in the data directory.
+        """
+        if self.layout != 'sharded':
+            print("\n\033[1mUser listing requires the sharded layout.\033[0m\n")
+            return []
+        return list_users(self.data_directory)
 
-        users[username] = password
+    def snapshot(self) -> Optional[HabitSnapshot]:
+        """
+        Return an immutable snapshot of the current user's habits.
 
-        with open(self.users_file, 'w') as f:
-            json.dump(users, f, indent=2)
+        Reports can hold the snapshot as long as they need without blocking check-offs, which
+        keep publishing newer snapshots.
+
+        Returns:
+            HabitSnapshot, optional: The latest snapshot, or None if no user is logged in.
+        """
+        if not self.snapshots:
+            return None
+        return self.snapshots.snapshot()
 
     def load_users(self) -> None:
         """
@@ -151,8 +231,7 @@ class UserConn:
         it initializes an empty user data store.
         """
         try:
-            with open(self.users_file, 'r') as f:
-                json.load(f)  # Check if the file is readable
+            json.loads(get_storage().read_text(self.users_file))  # Check if the file is readable
         except FileNotFoundError:
             print("\n\033[1mNo saved user data found, starting fresh.\033[0m")
 
@@ -162,8 +241,11 @@ class UserConn:
         """
         if self.current_user:
             self.habits = load_predefined_habits(self.habits)
-            habits_file = os.path.join(self.data_directory, f"{self.current_user}_habits.json")
-            save_data(self.habits, habits_file)
+            save_data(self.habits, self.habits_file(self.current_user))
+            self.record_habits_file(self.current_user)
+            self.listing.rebuild()
+            self.snapshots.invalidate()
+            self.snapshots.publish()
             view_all_habits(self.habits)
         else:
             print("\n\033[1mPlease login to load predefined habits.\033[0m\n")
@@ -176,11 +258,24 @@ class UserConn:
         is logged in, it will inform the user.
         """
         if self.current_user:
-            # Save habits before logging out
-            habits_file = os.path.join(self.data_directory, f"{self.current_user}_habits.json")
-            save_data(self.habits, habits_file)
+            # Save habits before logging out, archiving old check-offs if tiering is enabled
+            habits_file = self.habits_file(self.current_user)
+            if self.history_horizon_days:
+                try:
+                    archive_history(self.habits, habits_file, self.history_horizon_days)
+                except json.JSONDecodeError:
+                    # Keep every check-off in the habits file rather than overwrite the unreadable archive
+                    print("\n\033[1mCold archive is corrupt, old check-offs were not archived.\033[0m")
+                    save_data(self.habits, habits_file)
+            else:
+                save_data(self.habits, habits_file)
+            self.record_habits_file(self.current_user)
             print(f"\nUser \033[1m'{self.current_user}'\033[0m logged out.\n")
             self.current_user = None
-            self.habits = {}
+            self.habits = HabitSet()
+            self.listing.close()
+            self.listing = None
+            self.snapshots.close()
+            self.snapshots = None
         else:
             print("\n\033[1mNo user is currently logged in.\033[0m")